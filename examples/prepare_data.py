@@ -6,6 +6,8 @@ Hugging Faceからペルソナデータをダウンロード・サンプリン
 Usage:
     python examples/prepare_data.py
     python examples/prepare_data.py --sample-size 50 --output data/personas_50.json
+    python examples/prepare_data.py --sample-size 50 --max-scan 100000
+    python examples/prepare_data.py --seed 42
 """
 import argparse
 import sys
@@ -20,9 +22,11 @@ def main():
     parser = argparse.ArgumentParser(description="ペルソナデータ準備")
     parser.add_argument("--sample-size", type=int, default=100, help="サンプリング数（デフォルト: 100）")
     parser.add_argument("--output", type=str, default="data/personas_100.json", help="出力ファイルパス")
+    parser.add_argument("--max-scan", type=int, default=None, help="走査する最大件数（デフォルト: 全件）")
+    parser.add_argument("--seed", type=int, default=None, help="乱数シード（再現性のある抽出を行う場合に指定）")
     args = parser.parse_args()
 
-    prepare_persona_data(sample_size=args.sample_size, output_path=args.output)
+    prepare_persona_data(sample_size=args.sample_size, output_path=args.output, max_scan=args.max_scan, seed=args.seed)
 
 
 if __name__ == "__main__":
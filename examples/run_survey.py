@@ -6,6 +6,7 @@
 Usage:
     python examples/run_survey.py
     python examples/run_survey.py --input data/personas_50.json --output output/survey_50.csv
+    python examples/run_survey.py --concurrent 20
     python examples/run_survey.py --config /path/to/config.yaml
 """
 import argparse
@@ -23,6 +24,7 @@ def main():
     parser.add_argument("--config", type=str, default=None, help="設定ファイルパス（デフォルト: ./config.yaml）")
     parser.add_argument("--input", type=str, default=None, help="入力JSONファイル（config.yamlを上書き）")
     parser.add_argument("--output", type=str, default=None, help="出力CSVファイル（config.yamlを上書き）")
+    parser.add_argument("--concurrent", type=int, default=None, help="並列実行数（config.yamlを上書き）")
     args = parser.parse_args()
 
     config = load_config(args.config)
@@ -32,6 +34,8 @@ def main():
     if args.output:
         # 出力ファイルパスが指定された場合、output_dirを無視して直接使用
         config["survey"]["output_file"] = args.output
+    if args.concurrent:
+        config["survey"]["concurrent_limit"] = args.concurrent
 
     runner = SurveyRunner(config)
     runner.run()
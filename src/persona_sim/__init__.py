@@ -11,8 +11,21 @@ from .config import (
     get_openai_config,
     load_config,
 )
-from .llm import PROVIDER_MAP, create_llm
-from .prompts import get_interviewer_system_prompt, get_persona_system_prompt
+from .llm import (
+    PROVIDER_MAP,
+    build_system_content,
+    create_http_async_client,
+    create_llm,
+    mark_cache_breakpoint,
+    pooled_llm,
+)
+from .prompts import (
+    get_batch_persona_system_prompt,
+    get_interview_persona_system_prompt,
+    get_interviewer_system_prompt,
+    get_persona_system_prompt,
+    get_persona_system_prompt_blocks,
+)
 
 __all__ = [
     "load_config",
@@ -23,7 +36,14 @@ __all__ = [
     "get_openai_config",
     "get_groq_config",
     "create_llm",
+    "create_http_async_client",
+    "pooled_llm",
+    "build_system_content",
+    "mark_cache_breakpoint",
     "PROVIDER_MAP",
     "get_persona_system_prompt",
+    "get_persona_system_prompt_blocks",
+    "get_batch_persona_system_prompt",
+    "get_interview_persona_system_prompt",
     "get_interviewer_system_prompt",
 ]
@@ -2,28 +2,70 @@
 
 2つの案（プランA vs プランB）に対する受容性を比較検証する。
 LangGraphを使用して段階的な思考プロセスをシミュレーションする。
+プランA・Bの評価は互いに独立しているため並列に実行し、両方の完了後に最終決定を行う。
 """
 import asyncio
 import json
 import os
+import re
+from collections import Counter
+from functools import partial
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Iterator, Optional
 
 import pandas as pd
+from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import END, START, StateGraph
 from tqdm.asyncio import tqdm
 from typing_extensions import TypedDict
 
+from . import aio
+from .batch import run_batch
+from .cache import ResponseCache
 from .config import load_config
-from .llm import create_llm
-from .prompts import get_persona_system_prompt
+from .llm import build_system_content, create_llm, pooled_llm
+from .prompts import get_batch_persona_system_prompt, get_persona_system_prompt
+from .results import open_result_writer, read_results
+
+
+# プラン評価のユーザーメッセージ（ペルソナ単位）
+EVALUATION_PROMPT_TEMPLATE = """Please look at the following ad copy, rate it out of 10, and state your reason in one sentence.
+
+{plan}
+
+Answer Format:
+Score: (Number only)
+Impression: (Impression)
+"""
+
+# 評価コメント中のスコア（半角・全角コロン、Markdownの強調表記に対応）
+_SCORE_RE = re.compile(r"(?:Score|点数)[\s*]*[:：][\s*]*(\d+)")
+
+
+def _parse_score(content: str) -> int:
+    """評価コメントからスコアを読み取る。読み取れない場合は5とする。
+
+    Args:
+        content: LLMの評価コメント
+
+    Returns:
+        int: スコア
+    """
+    match = _SCORE_RE.search(content)
+    return int(match.group(1)) if match else 5
+
+
+# 出力CSVの列
+RESULT_COLUMNS = ["ID", "Age", "Occupation", "Hobbies", "Score_A", "Score_B", "Winner", "Reason"]
 
 
 class ABTestState(TypedDict):
     """A/Bテストの状態。"""
 
     persona_profile: dict
+    system_message: Optional[SystemMessage]  # ペルソナのシステムメッセージ（全ノード共通、プロンプトキャッシュ対象）
     eval_a: Optional[str]  # Aの評価コメント
     score_a: Optional[int]  # Aのスコア
     eval_b: Optional[str]  # Bの評価コメント
@@ -36,6 +78,7 @@ class ABTestRunner:
     """A/Bテスト実行クラス。
 
     LangGraphを使用して、ペルソナに2つのプランを評価させ、最終的にどちらを選択するかを決定させる。
+    勝者はスコアから決定し、同点の場合のみペルソナ自身に選ばせる。
     """
 
     def __init__(self, config: Optional[dict] = None):
@@ -48,6 +91,8 @@ class ABTestRunner:
 
         # LLM初期化
         self.llm = create_llm(self.config)
+        # レスポンスキャッシュ（無効の場合はNone）
+        self.cache = ResponseCache.from_config(self.config)
 
         # 設定値
         self.input_file = self.config["ab_test"]["input_file"]
@@ -55,6 +100,15 @@ class ABTestRunner:
         self.plan_a = self.config["ab_test"]["plan_a"]
         self.plan_b = self.config["ab_test"]["plan_b"]
         self.concurrent_limit = self.config.get("concurrent_limit", 10)
+        self.csv_encoding = self.config.get("csv_encoding", "utf-8")
+        # 1回のLLM呼び出しでまとめて評価するペルソナ数（1の場合はペルソナごとに評価）
+        self.batch_size = self.config["ab_test"].get("batch_size", 1)
+        # プロバイダーのBatch APIで評価を一括実行するか（非対話の一括処理向け、約50%安価）
+        self.provider_batch = self.config["ab_test"].get("provider_batch", False)
+
+        # プラン評価のユーザーメッセージ（全ペルソナ共通のため事前に生成）
+        self._eval_a_msg = EVALUATION_PROMPT_TEMPLATE.format(plan=self.plan_a)
+        self._eval_b_msg = EVALUATION_PROMPT_TEMPLATE.format(plan=self.plan_b)
 
         # LangGraphワークフロー構築
         self.app = self._build_workflow()
@@ -67,94 +121,115 @@ class ABTestRunner:
         """
         workflow = StateGraph(ABTestState)
 
-        workflow.add_node("evaluate_a", self._evaluate_a_node)
-        workflow.add_node("evaluate_b", self._evaluate_b_node)
+        workflow.add_node("prep", self._prep_node)
+        workflow.add_node(
+            "evaluate_a", partial(self._evaluate_plan, plan_msg=self._eval_a_msg, out_keys=("eval_a", "score_a"))
+        )
+        workflow.add_node(
+            "evaluate_b", partial(self._evaluate_plan, plan_msg=self._eval_b_msg, out_keys=("eval_b", "score_b"))
+        )
         workflow.add_node("decision", self._decision_node)
 
-        # フロー: 評価A → 評価B → 決定（順次実行）
-        workflow.add_edge(START, "evaluate_a")
-        workflow.add_edge("evaluate_a", "evaluate_b")
-        workflow.add_edge("evaluate_b", "decision")
-        workflow.add_edge(decision, END)
+        # フロー: 準備 → 評価A・評価B（並列実行）→ 決定
+        # 両ノードの更新キー（eval_a/score_a, eval_b/score_b）は重複しないため、そのままマージされる
+        workflow.add_edge(START, "prep")
+        workflow.add_edge("prep", "evaluate_a")
+        workflow.add_edge("prep", "evaluate_b")
+        workflow.add_edge(["evaluate_a", "evaluate_b"], "decision")
+        workflow.add_edge("decision", END)
 
         return workflow.compile()
 
-    async def _evaluate_a_node(self, state: ABTestState) -> dict:
-        """プランAを評価するノード。
+    async def _prep_node(self, state: ABTestState) -> dict:
+        """ペルソナのシステムメッセージを一度だけ生成するノード。
+
+        後続のノードが同一のメッセージを先頭に置くことで、プロバイダーのプロンプトキャッシュが効くようにする。
 
         Args:
             state: 現在の状態
 
         Returns:
-            dict: 更新された状態（eval_a, score_a）
+            dict: 更新された状態（system_message）
         """
-        prompt = get_persona_system_prompt(state["persona_profile"], detailed=False)
-        user_msg = f"""Please look at the following ad copy, rate it out of 10, and state your reason in one sentence.
+        return {"system_message": self._create_system_message(state["persona_profile"])}
 
-{self.plan_a}
+    def _create_system_message(self, persona: dict) -> SystemMessage:
+        """ペルソナのシステムメッセージを生成する。
 
-Answer Format:
-Score: (Number only)
-Impression: (Impression)
-"""
+        Args:
+            persona: ペルソナプロフィール
 
-        response = await self.llm.ainvoke([SystemMessage(content=prompt), HumanMessage(content=user_msg)])
-        content = response.content
+        Returns:
+            SystemMessage: システムメッセージ
+        """
+        prompt = get_persona_system_prompt(persona, detailed=False)
+        return SystemMessage(content=build_system_content(prompt, self.config))
 
-        try:
-            score_line = [line for line in content.split("\n") if "Score" in line or "点数" in line]
-            if score_line:
-                score = int(score_line[0].split(":")[-1].strip())
-            else:
-                score = 5
-        except Exception:
-            score = 5
+    async def _ainvoke(self, llm: BaseChatModel, messages: list) -> str:
+        """LLMを呼び出して応答テキストを返す。
 
-        return {"eval_a": content, "score_a": score}
+        レスポンスキャッシュが有効な場合、同じメッセージに対する過去の応答があればそれを返す。
 
-    async def _evaluate_b_node(self, state: ABTestState) -> dict:
-        """プランBを評価するノード。
+        Args:
+            llm: LLMクライアント
+            messages: 送信するメッセージリスト
+
+        Returns:
+            str: 応答テキスト
+        """
+        if self.cache is not None:
+            return await self.cache.ainvoke(llm, messages)
+
+        response = await llm.ainvoke(messages)
+        return response.content
+
+    async def _evaluate_plan(
+        self, state: ABTestState, config: RunnableConfig, plan_msg: str, out_keys: tuple[str, str]
+    ) -> dict:
+        """プランを評価するノード（プランA・B共通）。
 
         Args:
             state: 現在の状態
+            config: 実行時の設定（configurable.llm に使用するLLMクライアント）
+            plan_msg: 評価対象プランのユーザーメッセージ
+            out_keys: 評価コメントとスコアを格納するキー（例: ("eval_a", "score_a")）
 
         Returns:
-            dict: 更新された状態（eval_b, score_b）
+            dict: 更新された状態（out_keysの評価コメント, スコア）
         """
-        prompt = get_persona_system_prompt(state["persona_profile"], detailed=False)
-        user_msg = f"""Please look at the following ad copy, rate it out of 10, and state your reason in one sentence.
+        llm = config["configurable"]["llm"]
+        content = await self._ainvoke(llm, [state["system_message"], HumanMessage(content=plan_msg)])
 
-{self.plan_b}
+        eval_key, score_key = out_keys
+        return {eval_key: content, score_key: _parse_score(content)}
 
-Answer Format:
-Score: (Number only)
-Impression: (Impression)
-"""
+    async def _decision_node(self, state: ABTestState, config: RunnableConfig) -> dict:
+        """最終決定を行うノード。
 
-        response = await self.llm.ainvoke([SystemMessage(content=prompt), HumanMessage(content=user_msg)])
-        content = response.content
+        Args:
+            state: 現在の状態
+            config: 実行時の設定（configurable.llm に使用するLLMクライアント）
 
-        try:
-            score_line = [line for line in content.split("\n") if "Score" in line or "点数" in line]
-            if score_line:
-                score = int(score_line[0].split(":")[-1].strip())
-            else:
-                score = 5
-        except Exception:
-            score = 5
+        Returns:
+            dict: 更新された状態（winner, final_reason）
+        """
+        return await self._decide(state, config["configurable"]["llm"])
 
-        return {"eval_b": content, "score_b": score}
+    async def _decide(self, state: ABTestState, llm: BaseChatModel) -> dict:
+        """評価済みのプランA・Bから最終決定を行う。
 
-    async def _decision_node(self, state: ABTestState) -> dict:
-        """最終決定を行うノード。
+        勝者はスコアの比較で決定し、LLMは同点の場合のタイブレークにのみ使用する。
 
         Args:
             state: 現在の状態
+            llm: LLMクライアント
 
         Returns:
             dict: 更新された状態（winner, final_reason）
         """
-        prompt = get_persona_system_prompt(state["persona_profile"], detailed=False)
+        if state["score_a"] != state["score_b"]:
+            winner = "A" if state["score_a"] > state["score_b"] else "B"
+            return {"winner": winner, "final_reason": f"A: {state['eval_a']}\nB: {state['eval_b']}"}
 
         user_msg = f"""You have evaluated two plans.
 
@@ -172,40 +247,236 @@ Winner: (A or B)
 Reason: (Reason text)
 """
 
-        response = await self.llm.ainvoke([SystemMessage(content=prompt), HumanMessage(content=user_msg)])
-        content = response.content
+        content = await self._ainvoke(llm, [state["system_message"], HumanMessage(content=user_msg)])
 
         winner = "A" if "Winner: A" in content or "勝者: A" in content else "B"
         return {"winner": winner, "final_reason": content}
 
-    async def _run_single_test(self, persona: dict, semaphore: asyncio.Semaphore) -> Optional[dict]:
+    async def _run_single_test(self, persona: dict, llm: BaseChatModel) -> Optional[dict]:
         """単一ペルソナに対してA/Bテストを実行する。
 
         Args:
             persona: ペルソナプロフィール
-            semaphore: 並列実行制御用セマフォ
+            llm: LLMクライアント
 
         Returns:
             Optional[dict]: テスト結果
         """
-        async with semaphore:
+        try:
+            initial_state = {"persona_profile": persona}
+            final_state = await self.app.ainvoke(initial_state, config={"configurable": {"llm": llm}})
+
+            return self._create_result(persona, final_state)
+        except Exception as e:
+            print(f"Error {persona.get('uuid')}: {e}")
+            return None
+
+    async def _batch_evaluate(self, personas: list[dict], plan: str, llm: BaseChatModel) -> dict:
+        """複数ペルソナによるプラン評価を1回のLLM呼び出しでまとめて行う（行マーシャリング）。
+
+        Args:
+            personas: ペルソナプロフィールのリスト
+            plan: 評価対象のプラン文
+            llm: LLMクライアント
+
+        Returns:
+            dict: ペルソナIDをキーとした (評価コメント, スコア) の辞書。応答から読み取れなかったペルソナは含まない。
+        """
+        # プランA・Bの評価で同じシステムメッセージを使うため、キャッシュ対象とする
+        prompt = build_system_content(get_batch_persona_system_prompt(personas), self.config)
+        user_msg = f"""Each person listed above, please look at the following ad copy, rate it out of 10, and state your reason in one sentence.
+
+{plan}
+
+Answer Format:
+A JSON array only, with one object per person:
+[{{"id": "(id of the person)", "score": (Number only), "impression": "(Impression)"}}, ...]
+"""
+
+        content = await self._ainvoke(llm, [SystemMessage(content=prompt), HumanMessage(content=user_msg)])
+
+        # コードブロック等で囲まれていても配列部分だけを取り出す
+        try:
+            items = json.loads(content[content.index("[") : content.rindex("]") + 1])
+        except ValueError:
+            return {}
+
+        evaluations = {}
+        for item in items:
             try:
-                initial_state = {"persona_profile": persona}
-                final_state = await self.app.ainvoke(initial_state)
-
-                return {
-                    "ID": persona.get("uuid"),
-                    "Age": persona.get("age"),
-                    "Occupation": persona.get("occupation"),
-                    "Hobbies": str(persona.get("hobbies_and_interests"))[:30] + "...",
-                    "Score_A": final_state.get("score_a"),
-                    "Score_B": final_state.get("score_b"),
-                    "Winner": final_state.get("winner"),
-                    "Reason": str(final_state.get("final_reason")).replace("\n", " ")[:100] + "...",
-                }
-            except Exception as e:
-                print(f"Error {persona.get("uuid")}: {e}")
-                return None
+                score = int(item["score"])
+                evaluations[str(item["id"])] = (f"Score: {score}\nImpression: {item['impression']}", score)
+            except (KeyError, TypeError, ValueError):
+                continue
+
+        return evaluations
+
+    async def _run_batch_test(self, personas: list[dict], llm: BaseChatModel) -> list[Optional[dict]]:
+        """複数ペルソナに対してA/Bテストをまとめて実行する。
+
+        プランA・Bの評価をそれぞれ1回のLLM呼び出しで行い、最終決定はペルソナごとに行う。
+        バッチ応答から評価を読み取れなかったペルソナは個別に再評価する。
+
+        Args:
+            personas: ペルソナプロフィールのリスト
+            llm: LLMクライアント
+
+        Returns:
+            list[Optional[dict]]: テスト結果のリスト
+        """
+        try:
+            evals_a, evals_b = await asyncio.gather(
+                self._batch_evaluate(personas, self.plan_a, llm),
+                self._batch_evaluate(personas, self.plan_b, llm),
+            )
+        except Exception as e:
+            print(f"Error batch ({len(personas)} people): {e}")
+            evals_a, evals_b = {}, {}
+
+        async def finish(persona: dict) -> Optional[dict]:
+            uuid = str(persona.get("uuid"))
+            if uuid not in evals_a or uuid not in evals_b:
+                return await self._run_single_test(persona, llm)
+            return await self._finish_test(persona, evals_a[uuid], evals_b[uuid], llm)
+
+        return await asyncio.gather(*(finish(p) for p in personas))
+
+    async def _finish_test(
+        self, persona: dict, eval_a: tuple[str, int], eval_b: tuple[str, int], llm: BaseChatModel
+    ) -> Optional[dict]:
+        """評価済みのプランA・Bから最終決定を行い、結果レコードを作成する（バッチ評価用）。
+
+        Args:
+            persona: ペルソナプロフィール
+            eval_a: プランAの (評価コメント, スコア)
+            eval_b: プランBの (評価コメント, スコア)
+            llm: LLMクライアント
+
+        Returns:
+            Optional[dict]: テスト結果
+        """
+        try:
+            state = {
+                "persona_profile": persona,
+                "system_message": self._create_system_message(persona),
+                "eval_a": eval_a[0],
+                "score_a": eval_a[1],
+                "eval_b": eval_b[0],
+                "score_b": eval_b[1],
+            }
+            state.update(await self._decide(state, llm))
+            return self._create_result(persona, state)
+        except Exception as e:
+            print(f"Error {persona.get('uuid')}: {e}")
+            return None
+
+    async def _run_provider_batch(
+        self, personas: list[dict], concurrent_limit: int, llm: BaseChatModel
+    ) -> list[dict]:
+        """プロバイダーのBatch APIで全ペルソナのプランA・B評価を一括実行する。
+
+        評価はBatch APIで行い、同点時の最終決定と、Batchで失敗したペルソナの再評価のみ通常のAPIで行う。
+
+        Args:
+            personas: ペルソナプロフィールのリスト
+            concurrent_limit: 通常APIでの後処理の並列実行数
+            llm: 通常APIでの後処理に使用するLLMクライアント
+
+        Returns:
+            list[dict]: テスト結果のリスト
+        """
+        requests = []
+        for i, persona in enumerate(personas):
+            prompt = get_persona_system_prompt(persona, detailed=False)
+            requests.append((f"p{i}-a", prompt, self._eval_a_msg))
+            requests.append((f"p{i}-b", prompt, self._eval_b_msg))
+
+        outputs = await run_batch(requests, self.config)
+
+        semaphore = asyncio.Semaphore(concurrent_limit)
+
+        async def finish(i: int, persona: dict) -> Optional[dict]:
+            content_a, content_b = outputs.get(f"p{i}-a"), outputs.get(f"p{i}-b")
+            async with semaphore:
+                if content_a is None or content_b is None:
+                    return await self._run_single_test(persona, llm)
+                return await self._finish_test(
+                    persona, (content_a, _parse_score(content_a)), (content_b, _parse_score(content_b)), llm
+                )
+
+        results = await tqdm.gather(*(finish(i, p) for i, p in enumerate(personas)))
+        return [res for res in results if res]
+
+    def _create_result(self, persona: dict, final_state: dict) -> dict:
+        """最終状態から出力用の結果レコードを作成する。
+
+        Args:
+            persona: ペルソナプロフィール
+            final_state: ワークフローの最終状態
+
+        Returns:
+            dict: テスト結果
+        """
+        return {
+            "ID": persona.get("uuid"),
+            "Age": persona.get("age"),
+            "Occupation": persona.get("occupation"),
+            "Hobbies": str(persona.get("hobbies_and_interests"))[:30] + "...",
+            "Score_A": final_state.get("score_a"),
+            "Score_B": final_state.get("score_b"),
+            "Winner": final_state.get("winner"),
+            "Reason": str(final_state.get("final_reason")).replace("\n", " ")[:100] + "...",
+        }
+
+    def _chunk(self, personas: Iterator[dict]) -> Iterator[list[dict]]:
+        """ペルソナを batch_size 人ずつのチャンクに分割する。
+
+        Args:
+            personas: ペルソナデータのイテレータ
+
+        Yields:
+            list[dict]: ペルソナのチャンク
+        """
+        chunk = []
+        for persona in personas:
+            chunk.append(persona)
+            if len(chunk) == self.batch_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    async def _execute(
+        self, personas: Iterator[dict], on_result: Callable[[dict], None], concurrent_limit: int, llm: BaseChatModel
+    ) -> None:
+        """全ペルソナに対してA/Bテストを実行し、結果を1件ずつコールバックへ渡す。
+
+        Args:
+            personas: ペルソナデータのイテレータ
+            on_result: 結果1件ごとに呼び出すコールバック
+            concurrent_limit: 並列実行数
+            llm: LLMクライアント
+        """
+        if self.provider_batch:
+            for res in await self._run_provider_batch(list(personas), concurrent_limit, llm):
+                on_result(res)
+            return
+
+        # ワーカープール: concurrent_limit 個のワーカーが batch_size 人ずつのチャンクを取り出して実行する
+        with tqdm(unit="people") as progress:
+
+            async def test(chunk: list[dict]) -> None:
+                if len(chunk) == 1:
+                    chunk_results = [await self._run_single_test(chunk[0], llm)]
+                else:
+                    chunk_results = await self._run_batch_test(chunk, llm)
+
+                for res in chunk_results:
+                    if res:
+                        on_result(res)
+                progress.update(len(chunk))
+
+            await aio.run_worker_pool(self._chunk(personas), test, concurrent_limit)
 
     async def run_async(
         self,
@@ -231,42 +502,43 @@ Reason: (Reason text)
         # 出力ディレクトリ作成
         os.makedirs(os.path.dirname(output_file), exist_ok=True)
 
-        # ペルソナデータ読み込み
-        from .data import load_personas
+        # ペルソナデータ読み込み（ストリーミング）
+        from .data import iter_personas
 
-        personas = load_personas(input_file)
+        personas = iter_personas(input_file)
 
-        print(f"⚖️  AB Test Start: {len(personas)} people (Plan A vs Plan B)")
+        print("⚖️  AB Test Start (Plan A vs Plan B)")
 
-        semaphore = asyncio.Semaphore(concurrent_limit)
-        tasks = [self._run_single_test(p, semaphore) for p in personas]
+        # 勝者ごとの職業別カウント（勝利数はその合計）
+        occupations = {"A": Counter(), "B": Counter()}
+
+        # 各ワーカーはプランA・Bの評価を同時に送信し、バッチ評価ではタイブレーク等をペルソナごとに並列に送信する
+        async with pooled_llm(self.config, 2 * concurrent_limit * self.batch_size) as llm:
+            with open_result_writer(output_file, RESULT_COLUMNS, self.csv_encoding) as write_row:
 
-        results = []
-        for f in tqdm(asyncio.as_completed(tasks), total=len(tasks)):
-            res = await f
-            if res:
-                results.append(res)
+                def on_result(res: dict) -> None:
+                    write_row(res)
+                    if res["Winner"] in occupations:
+                        occupations[res["Winner"]][res["Occupation"]] += 1
 
-        # 結果の保存
-        df = pd.DataFrame(results)
-        df.to_csv(output_file, index=False, encoding="utf-8-sig")
+                await self._execute(personas, on_result, concurrent_limit, llm)
 
         print(f"\n✅ Test Completed. Saved to '{output_file}'.")
 
         # 集計結果表示
-        if not df.empty and "Winner" in df.columns:
-            win_a = len(df[df["Winner"] == "A"])
-            win_b = len(df[df["Winner"] == "B"])
+        win_a, win_b = occupations["A"].total(), occupations["B"].total()
+        if win_a or win_b:
             print("\n=== Aggregation Result ===")
             print(f"🏆 Plan A Wins: {win_a}")
             print(f"🏆 Plan B Wins: {win_b}")
 
             # 職業別トレンド（スニペット）
-            if "Occupation" in df.columns:
-                print("\n=== Trend by Occupation (Top 5) ===")
-                print(df.groupby("Winner")["Occupation"].value_counts().head(5))
+            print("\n=== Trend by Occupation (Top 5) ===")
+            for winner, counter in occupations.items():
+                for occupation, count in counter.most_common(5):
+                    print(f"{winner}  {occupation}: {count}")
 
-        return df
+        return read_results(output_file, self.csv_encoding)
 
     def run(
         self,
@@ -284,4 +556,4 @@ Reason: (Reason text)
         Returns:
             pd.DataFrame: テスト結果
         """
-        return asyncio.run(self.run_async(input_file, output_file, concurrent_limit))
+        return aio.run(self.run_async(input_file, output_file, concurrent_limit))
@@ -0,0 +1,63 @@
+"""非同期実行ユーティリティモジュール。
+
+同期APIから非同期処理を実行するための共通処理と、固定数のワーカーによる並列実行を提供する。
+"""
+import asyncio
+from typing import Awaitable, Callable, Coroutine, Iterable, TypeVar
+
+try:
+    import uvloop
+except ImportError:  # Windows等、uvloopが利用できない環境では標準のイベントループを使用する
+    uvloop = None
+
+T = TypeVar("T")
+
+# ワーカーへの終了通知
+_DONE = object()
+
+
+def run(coro: Coroutine[object, object, T]) -> T:
+    """コルーチンを新しいイベントループで実行する。
+
+    uvloopがインストールされている場合は、多数の小さなI/O待ちを高速にスケジュールできるuvloopのイベントループを使用する。
+    グローバルなイベントループポリシーは変更しないため、ライブラリ利用側の環境には影響しない。
+
+    Args:
+        coro: 実行するコルーチン
+
+    Returns:
+        T: コルーチンの戻り値
+    """
+    if uvloop is not None:
+        return uvloop.run(coro)
+    return asyncio.run(coro)
+
+
+async def run_worker_pool(items: Iterable[T], handler: Callable[[T], Awaitable[None]], concurrent_limit: int) -> None:
+    """固定数のワーカーでアイテムを並列に処理する。
+
+    concurrent_limit 個のワーカーが上限付きのキューからアイテムを取り出して handler を実行する。
+    アイテムはワーカーの処理に合わせて逐次投入するため、同時に存在するコルーチンとアイテムは並列実行数に比例する。
+    handler 内の例外は呼び出し元へ送出されるため、アイテム単位の失敗は handler 内で処理すること。
+
+    Args:
+        items: 処理するアイテム（イテレータも可）
+        handler: アイテム1件を処理するコルーチン関数
+        concurrent_limit: ワーカー数
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrent_limit * 2)
+
+    async def produce() -> None:
+        # 投入完了後（または読み込み失敗時）に、ワーカー数分の終了通知を投入する
+        try:
+            for item in items:
+                await queue.put(item)
+        finally:
+            for _ in range(concurrent_limit):
+                await queue.put(_DONE)
+
+    async def work() -> None:
+        while (item := await queue.get()) is not _DONE:
+            await handler(item)
+
+    await asyncio.gather(produce(), *(work() for _ in range(concurrent_limit)))
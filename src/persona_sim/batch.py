@@ -0,0 +1,295 @@
+"""プロバイダーBatch APIモジュール。
+
+OpenAI / Azure OpenAI のBatch API、AnthropicのMessage Batches APIを使用して、
+大量のリクエストを非対話的に一括実行する。結果は最大24時間以内に返却され、料金は通常の約50%となる。
+"""
+import asyncio
+import json
+from typing import Callable, Optional, TypeVar, Union
+
+from anthropic import AsyncAnthropic
+from openai import AsyncAzureOpenAI, AsyncOpenAI
+
+from .config import (
+    get_anthropic_config,
+    get_azure_openai_config,
+    get_llm_provider,
+    get_openai_config,
+    load_config,
+)
+from .llm import _get_model_params
+
+# Batch APIに対応しているプロバイダー
+BATCH_PROVIDERS = ("azure_openai", "openai", "anthropic")
+
+# OpenAI系Batchの終了ステータス
+_OPENAI_TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+# 1バッチあたりの上限（リクエスト数, 入力サイズ[バイト]）。サイズは余裕を持たせて10進数のMBで扱う
+_OPENAI_BATCH_LIMITS = (50_000, 200 * 1000 * 1000)
+_ANTHROPIC_BATCH_LIMITS = (100_000, 256 * 1000 * 1000)
+
+T = TypeVar("T")
+
+
+async def run_batch(
+    requests: list[tuple[str, str, str]],
+    config: Optional[dict] = None,
+    poll_interval: float = 30.0,
+) -> dict[str, str]:
+    """リクエスト群をプロバイダーのBatch APIで一括実行する。
+
+    リクエスト数・入力サイズがプロバイダーの1バッチあたりの上限を超える場合は、複数のバッチに分割して並行に投入し、
+    結果を統合して返す。一部のバッチのみが失敗した場合、そのバッチのリクエストは結果に含まれない。
+
+    Args:
+        requests: (custom_id, システムプロンプト, ユーザーメッセージ) のリスト。
+            custom_id は英数字・ハイフン・アンダースコアのみ、64文字以内とする。
+        config: 設定辞書（オプション）。指定しない場合はconfig.yamlから読み込む。
+        poll_interval: ステータス確認の間隔（秒）
+
+    Returns:
+        dict[str, str]: custom_id をキーとした応答テキストの辞書。失敗したリクエストは含まない。
+
+    Raises:
+        ValueError: Batch APIに対応していないプロバイダーが指定された場合
+        RuntimeError: すべてのバッチが失敗・期限切れ・キャンセルとなった場合
+    """
+    if config is None:
+        config = load_config()
+
+    provider = get_llm_provider(config)
+
+    if provider in ("azure_openai", "openai"):
+        return await _run_openai_batch(requests, provider, config, poll_interval)
+    elif provider == "anthropic":
+        return await _run_anthropic_batch(requests, config, poll_interval)
+    else:
+        supported = ", ".join(BATCH_PROVIDERS)
+        raise ValueError(f"Provider '{provider}' does not support Batch API. Supported providers: {supported}")
+
+
+async def _run_openai_batch(
+    requests: list[tuple[str, str, str]],
+    provider: str,
+    config: dict,
+    poll_interval: float,
+) -> dict[str, str]:
+    """OpenAI / Azure OpenAI のBatch APIで一括実行する。
+
+    Args:
+        requests: (custom_id, システムプロンプト, ユーザーメッセージ) のリスト
+        provider: プロバイダー名（azure_openai or openai）
+        config: 設定辞書
+        poll_interval: ステータス確認の間隔（秒）
+
+    Returns:
+        dict[str, str]: custom_id をキーとした応答テキストの辞書
+    """
+    model_params = _get_model_params(config)
+
+    if provider == "azure_openai":
+        provider_config = get_azure_openai_config(config)
+        client = AsyncAzureOpenAI(
+            azure_endpoint=provider_config["endpoint"],
+            api_key=provider_config["api_key"],
+            api_version=provider_config["api_version"],
+        )
+        model = provider_config["deployment_name"]
+        url = "/chat/completions"
+    else:
+        provider_config = get_openai_config(config)
+        client = AsyncOpenAI(api_key=provider_config["api_key"], base_url=provider_config.get("base_url"))
+        model = provider_config.get("model", "gpt-4o")
+        url = "/v1/chat/completions"
+
+    body_params = {}
+    if "temperature" in model_params:
+        body_params["temperature"] = model_params["temperature"]
+    if "max_tokens" in model_params:
+        body_params["max_completion_tokens"] = model_params["max_tokens"]
+
+    # リクエストをJSONL形式にシリアライズ
+    lines = [
+        json.dumps(
+            {
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": url,
+                "body": {
+                    "model": model,
+                    "messages": [
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_msg},
+                    ],
+                    **body_params,
+                },
+            },
+            ensure_ascii=False,
+        ).encode("utf-8")
+        for custom_id, system_prompt, user_msg in requests
+    ]
+    # 改行区切りの分を含めて入力ファイルのサイズを見積もる
+    chunks = _split_batches(lines, *_OPENAI_BATCH_LIMITS, size_of=lambda line: len(line) + 1)
+    del lines
+
+    async def submit(chunk: list[bytes]) -> Optional[dict[str, str]]:
+        payload = b"\n".join(chunk) + b"\n"
+        input_file = await client.files.create(file=("batch_input.jsonl", payload), purpose="batch")
+        batch = await client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+        print(f"📦 Batch submitted: {batch.id} ({len(chunk)} requests)")
+
+        while batch.status not in _OPENAI_TERMINAL_STATUSES:
+            await asyncio.sleep(poll_interval)
+            batch = await client.batches.retrieve(batch.id)
+
+        if batch.status != "completed":
+            print(f"Batch {batch.id} ended with status '{batch.status}'.")
+            return None
+
+        results = {}
+        if batch.output_file_id:
+            output = await client.files.content(batch.output_file_id)
+            for line in output.text.splitlines():
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                response = entry.get("response") or {}
+                if response.get("status_code") == 200:
+                    results[entry["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+        return results
+
+    async with client:
+        # 一部のバッチの投入・取得に失敗しても、他のバッチの完了を待って結果を統合する
+        return _merge_results(await asyncio.gather(*(submit(chunk) for chunk in chunks), return_exceptions=True))
+
+
+async def _run_anthropic_batch(
+    requests: list[tuple[str, str, str]],
+    config: dict,
+    poll_interval: float,
+) -> dict[str, str]:
+    """AnthropicのMessage Batches APIで一括実行する。
+
+    Args:
+        requests: (custom_id, システムプロンプト, ユーザーメッセージ) のリスト
+        config: 設定辞書
+        poll_interval: ステータス確認の間隔（秒）
+
+    Returns:
+        dict[str, str]: custom_id をキーとした応答テキストの辞書
+    """
+    provider_config = get_anthropic_config(config)
+    model_params = _get_model_params(config)
+
+    # Anthropicはmax_tokensを必須とする
+    params = {
+        "model": provider_config.get("model", "claude-sonnet-4-20250514"),
+        "max_tokens": model_params.get("max_tokens", provider_config.get("max_tokens", 8192)),
+    }
+    if "temperature" in model_params:
+        params["temperature"] = model_params["temperature"]
+
+    client = AsyncAnthropic(api_key=provider_config["api_key"])
+
+    entries = [
+        {
+            "custom_id": custom_id,
+            "params": {
+                **params,
+                # 同一ペルソナのリクエスト間で共通のシステムプロンプトをキャッシュ対象とする
+                "system": [{"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}],
+                "messages": [{"role": "user", "content": user_msg}],
+            },
+        }
+        for custom_id, system_prompt, user_msg in requests
+    ]
+    # 送信時のエスケープ有無に依存しないよう、サイズが大きくなるASCIIエスケープで見積もる
+    chunks = _split_batches(entries, *_ANTHROPIC_BATCH_LIMITS, size_of=lambda entry: len(json.dumps(entry)) + 1)
+    del entries
+
+    async def submit(chunk: list[dict]) -> Optional[dict[str, str]]:
+        batch = await client.messages.batches.create(requests=chunk)
+        print(f"📦 Batch submitted: {batch.id} ({len(chunk)} requests)")
+
+        while batch.processing_status != "ended":
+            await asyncio.sleep(poll_interval)
+            batch = await client.messages.batches.retrieve(batch.id)
+
+        results = {}
+        async for entry in await client.messages.batches.results(batch.id):
+            if entry.result.type == "succeeded":
+                results[entry.custom_id] = "".join(
+                    block.text for block in entry.result.message.content if block.type == "text"
+                )
+
+        # Message Batches APIはバッチ全体の失敗をステータスで返さないため、成功した応答がない場合を失敗とする
+        if not results:
+            print(f"Batch {batch.id} ended without any succeeded requests.")
+            return None
+        return results
+
+    async with client:
+        # 一部のバッチの投入・取得に失敗しても、他のバッチの完了を待って結果を統合する
+        return _merge_results(await asyncio.gather(*(submit(chunk) for chunk in chunks), return_exceptions=True))
+
+
+def _split_batches(entries: list[T], max_requests: int, max_bytes: int, size_of: Callable[[T], int]) -> list[list[T]]:
+    """リクエストを1バッチあたりの上限（リクエスト数・入力サイズ）に収まるように分割する。
+
+    Args:
+        entries: リクエストのリスト
+        max_requests: 1バッチあたりの最大リクエスト数
+        max_bytes: 1バッチあたりの最大入力サイズ（バイト）
+        size_of: リクエスト1件の入力サイズ（バイト）を返す関数
+
+    Returns:
+        list[list[T]]: バッチごとのリクエストのリスト
+    """
+    chunks: list[list[T]] = []
+    current: list[T] = []
+    current_bytes = 0
+    for entry in entries:
+        entry_bytes = size_of(entry)
+        if current and (len(current) >= max_requests or current_bytes + entry_bytes > max_bytes):
+            chunks.append(current)
+            current, current_bytes = [], 0
+        current.append(entry)
+        current_bytes += entry_bytes
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _merge_results(batch_results: list[Union[dict[str, str], None, BaseException]]) -> dict[str, str]:
+    """バッチごとの結果を統合する。
+
+    投入・取得中に例外が発生したバッチは、失敗したバッチとして扱う。
+
+    Args:
+        batch_results: バッチごとの結果（失敗したバッチは None、例外が発生したバッチはその例外）
+
+    Returns:
+        dict[str, str]: custom_id をキーとした応答テキストの辞書
+
+    Raises:
+        RuntimeError: すべてのバッチが失敗した場合
+    """
+    for i, results in enumerate(batch_results):
+        if isinstance(results, BaseException):
+            if not isinstance(results, Exception):
+                raise results
+            print(f"Batch {i + 1}/{len(batch_results)} failed: {results}")
+            batch_results[i] = None
+
+    if batch_results and all(results is None for results in batch_results):
+        raise RuntimeError("All batches ended without completing.")
+
+    merged: dict[str, str] = {}
+    for results in batch_results:
+        merged.update(results or {})
+    return merged
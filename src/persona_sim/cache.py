@@ -0,0 +1,158 @@
+"""レスポンスキャッシュモジュール。
+
+LLMの応答をSQLiteファイルに永続化し、同じ入力での再実行時にAPI呼び出しを省略する。
+キーはモデル設定と送信メッセージの内容から生成するため、プランやプロンプトを変更した行だけが再実行される。
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+
+from .llm import _get_llm_settings
+
+# デフォルトのキャッシュファイルパス
+DEFAULT_CACHE_PATH = ".cache/responses.sqlite3"
+
+
+class ResponseCache:
+    """LLM応答の永続キャッシュ。
+
+    SQLiteファイルにキーと応答テキストを保存する。スレッドから同時に呼び出されても安全。
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, namespace: str = ""):
+        """初期化。
+
+        Args:
+            path: キャッシュファイルパス
+            namespace: キーに含める名前空間（使用するモデルの設定など）
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    @classmethod
+    def from_config(cls, config: dict) -> Optional["ResponseCache"]:
+        """設定からキャッシュを作成する。
+
+        Args:
+            config: 設定辞書
+
+        Returns:
+            Optional[ResponseCache]: キャッシュ。response_cache.enabled が無効の場合はNone。
+        """
+        cache_config = config.get("response_cache") or {}
+        if not cache_config.get("enabled", False):
+            return None
+
+        return cls(cache_config.get("path", DEFAULT_CACHE_PATH), namespace=_get_llm_signature(config))
+
+    def make_key(self, messages: list[BaseMessage], params: Optional[dict] = None) -> str:
+        """送信メッセージからキャッシュキーを生成する。
+
+        Args:
+            messages: LLMに送信するメッセージリスト
+            params: 呼び出しごとに指定したパラメータ（オプション）
+
+        Returns:
+            str: キャッシュキー
+        """
+        key = [self.namespace, [(message.type, message.content) for message in messages]]
+        if params:
+            key.append(params)
+        payload = json.dumps(key, ensure_ascii=False, sort_keys=True)
+        return hashlib.blake2b(payload.encode("utf-8"), digest_size=32).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """キャッシュされた応答を取得する。
+
+        Args:
+            key: キャッシュキー
+
+        Returns:
+            Optional[str]: 応答テキスト。キャッシュされていない場合はNone。
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str) -> None:
+        """応答をキャッシュに保存する。
+
+        Args:
+            key: キャッシュキー
+            value: 応答テキスト
+        """
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO responses (key, value) VALUES (?, ?)", (key, value))
+
+    def invoke(self, llm: BaseChatModel, messages: list[BaseMessage], **kwargs) -> str:
+        """キャッシュを参照してLLMを呼び出し、応答テキストを返す。
+
+        Args:
+            llm: LLMクライアント
+            messages: 送信するメッセージリスト
+            **kwargs: 呼び出しごとに指定するパラメータ（max_tokens等）。キャッシュキーにも含める。
+
+        Returns:
+            str: 応答テキスト
+        """
+        key = self.make_key(messages, kwargs)
+        if (cached := self.get(key)) is not None:
+            return cached
+
+        response = llm.invoke(messages, **kwargs)
+        self.set(key, response.content)
+        return response.content
+
+    async def ainvoke(self, llm: BaseChatModel, messages: list[BaseMessage], **kwargs) -> str:
+        """キャッシュを参照してLLMを非同期で呼び出し、応答テキストを返す。
+
+        Args:
+            llm: LLMクライアント
+            messages: 送信するメッセージリスト
+            **kwargs: 呼び出しごとに指定するパラメータ（max_tokens等）。キャッシュキーにも含める。
+
+        Returns:
+            str: 応答テキスト
+        """
+        key = self.make_key(messages, kwargs)
+        if (cached := self.get(key)) is not None:
+            return cached
+
+        response = await llm.ainvoke(messages, **kwargs)
+        self.set(key, response.content)
+        return response.content
+
+
+def _get_llm_signature(config: dict) -> str:
+    """キャッシュの名前空間として使用するモデル設定の識別子を生成する。
+
+    Args:
+        config: 設定辞書
+
+    Returns:
+        str: プロバイダー・モデル・モデルパラメータを含む識別子
+    """
+    # APIキーや接続先は応答内容に影響しないため、モデルの識別に必要な項目のみを使用する
+    settings = _get_llm_settings(config)
+    provider = settings["llm_provider"]
+    provider_config = settings[provider]
+
+    return json.dumps(
+        {
+            "provider": provider,
+            "model": provider_config.get("model") or provider_config.get("deployment_name"),
+            "model_params": settings["model_params"],
+        },
+        sort_keys=True,
+    )
@@ -2,7 +2,9 @@
 
 環境変数 CONFIG_PATH から設定ファイルパスを解決し、YAML設定を読み込む。
 """
+import copy
 import os
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional
 
@@ -43,6 +45,9 @@ def get_config_path(config_path: Optional[str] = None) -> Path:
 def load_config(config_path: Optional[str] = None) -> dict:
     """YAML設定ファイルを読み込む。
 
+    解析結果はファイルパスと更新時刻ごとにキャッシュし、ファイルが変更されていなければ再解析しない。
+    呼び出し側で変更しても他に影響しないよう、毎回コピーを返す。
+
     Args:
         config_path: 設定ファイルパス（オプション）
 
@@ -60,10 +65,14 @@ def load_config(config_path: Optional[str] = None) -> dict:
             f"Please create a config.yaml file or set CONFIG_PATH environment variable."
         )
 
-    with open(config_file, "r", encoding="utf-8") as f:
-        config = yaml.safe_load(f)
+    return copy.deepcopy(_read_config(str(config_file.resolve()), config_file.stat().st_mtime_ns))
 
-    return config
+
+@lru_cache(maxsize=8)
+def _read_config(config_file: str, mtime_ns: int) -> dict:
+    """YAML設定ファイルを解析する（キャッシュ用、mtime_ns はキャッシュキーとしてのみ使用）。"""
+    with open(config_file, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)
 
 
 def get_llm_provider(config: Optional[dict] = None) -> str:
@@ -1,27 +1,49 @@
 """データ準備モジュール。
 
-Hugging Faceからペルソナデータをダウンロード・サンプリングし、JSON形式で保存する。
+Hugging Faceからペルソナデータをストリーミング取得・サンプリングし、JSON形式で保存する。
 """
-import json
 import random
+from itertools import islice
 from pathlib import Path
-from typing import Optional
+from typing import Iterable, Iterator, Optional
 
+import ijson
+import orjson
 from datasets import load_dataset
 from tqdm import tqdm
 
+# 実行時に使用するペルソナの項目（プロンプト生成と結果出力で参照するもののみ）
+PERSONA_FIELDS = (
+    "uuid",
+    "age",
+    "sex",
+    "prefecture",
+    "region",
+    "occupation",
+    "persona",
+    "professional_persona",
+    "hobbies_and_interests",
+    "cultural_background",
+)
+
 
 def prepare_persona_data(
     sample_size: int = 100,
     output_path: str = "data/personas_100.json",
     show_progress: bool = True,
+    max_scan: Optional[int] = None,
+    seed: Optional[int] = None,
 ) -> list[dict]:
-    """Hugging Faceからペルソナデータをダウンロード・サンプリングして保存する。
+    """Hugging Faceからペルソナデータをストリーミング取得・サンプリングして保存する。
+
+    データセット全体をダウンロードせず、ストリーミングで読みながらリザーバーサンプリングで抽出する。
 
     Args:
         sample_size: サンプリング数（デフォルト: 100）
         output_path: 出力ファイルパス（デフォルト: data/personas_100.json）
         show_progress: 進捗バーを表示するか（デフォルト: True）
+        max_scan: 走査する最大件数（オプション）。指定しない場合はデータセットの末尾まで走査する。
+        seed: 乱数シード（オプション）。指定すると同じデータセットから同じペルソナが抽出される。
 
     Returns:
         list[dict]: サンプリングされたペルソナデータリスト
@@ -32,30 +54,41 @@ def prepare_persona_data(
     output_file.parent.mkdir(parents=True, exist_ok=True)
 
     if show_progress:
-        print("📥 データセットをHugging Faceからダウンロード中...")
+        print("📥 データセットをHugging Faceからストリーミング取得します...")
 
-    # NVIDIAのデータセットをロード
-    dataset = load_dataset("nvidia/Nemotron-Personas-Japan", split="train")
-
-    total_count = len(dataset)
-    if show_progress:
-        print(f"✅ データセットロード完了 (全 {total_count} 件)")
+    # NVIDIAのデータセットをストリーミングでロード（全シャードはダウンロードしない）
+    dataset = load_dataset("nvidia/Nemotron-Personas-Japan", split="train", streaming=True)
 
-    # ランダムにサンプリング
+    # リザーバーサンプリング（Algorithm R）で抽出
     if show_progress:
         print(f"🎲 ランダムに {sample_size} 件を抽出中...")
 
-    random_indices = random.sample(range(total_count), sample_size)
+    rng = random.Random(seed)
+    sampled_personas = []
+    scanned_count = 0
+    rows = islice(dataset, max_scan)
+    for i, row in enumerate(tqdm(rows, total=max_scan, disable=not show_progress)):
+        if i < sample_size:
+            sampled_personas.append(row)
+        else:
+            # i+1 件目は sample_size/(i+1) の確率でリザーバー内のランダムな1件と置き換える
+            j = rng.randint(0, i)
+            if j < sample_size:
+                sampled_personas[j] = row
+        scanned_count = i + 1
+
+    rng.shuffle(sampled_personas)
 
-    # データセットから抽出してリスト化
-    sampled_personas = [dataset[i] for i in random_indices]
+    if show_progress:
+        print(f"✅ {scanned_count} 件を走査し、{len(sampled_personas)} 件を抽出しました。")
 
     # JSONとして保存
     if show_progress:
         print(f"💾 '{output_path}' に保存中...")
 
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(sampled_personas, f, ensure_ascii=False, indent=4)
+    # orjsonは非ASCII文字をそのままUTF-8で出力する
+    with open(output_path, "wb") as f:
+        f.write(orjson.dumps(sampled_personas, option=orjson.OPT_INDENT_2))
 
     if show_progress:
         print("✨ 完了しました。")
@@ -63,18 +96,19 @@ def prepare_persona_data(
     return sampled_personas
 
 
-def load_personas(input_path: str) -> list[dict]:
+def load_personas(input_path: str, fields: Optional[Iterable[str]] = PERSONA_FIELDS) -> list[dict]:
     """JSONファイルからペルソナデータを読み込む。
 
     Args:
         input_path: 入力JSONファイルパス
+        fields: 残す項目（デフォルト: PERSONA_FIELDS）。Noneの場合は全項目を残す。
 
     Returns:
         list[dict]: ペルソナデータリスト
 
     Raises:
         FileNotFoundError: ファイルが存在しない場合
-        json.JSONDecodeError: JSON形式が不正な場合
+        orjson.JSONDecodeError: JSON形式が不正な場合
     """
     input_file = Path(input_path)
 
@@ -83,9 +117,53 @@ def load_personas(input_path: str) -> list[dict]:
 
     print(f"📖 {input_path} を読み込み中...")
 
-    with open(input_file, "r", encoding="utf-8") as f:
-        personas = json.load(f)
+    with open(input_file, "rb") as f:
+        personas = orjson.loads(f.read())
+
+    if fields is not None:
+        personas = [_project(persona, fields) for persona in personas]
 
     print(f"✅ {len(personas)} 人のペルソナを読み込みました。")
 
     return personas
+
+
+def iter_personas(input_path: str, fields: Optional[Iterable[str]] = PERSONA_FIELDS) -> Iterator[dict]:
+    """JSONファイルからペルソナデータを1件ずつ読み込む。
+
+    ファイル全体をメモリに展開せず、ストリーミングで解析しながら順に返す。
+
+    Args:
+        input_path: 入力JSONファイルパス
+        fields: 残す項目（デフォルト: PERSONA_FIELDS）。Noneの場合は全項目を残す。
+
+    Returns:
+        Iterator[dict]: ペルソナデータのイテレータ
+
+    Raises:
+        FileNotFoundError: ファイルが存在しない場合
+    """
+    input_file = Path(input_path)
+
+    # ファイルの存在はイテレーション開始前に確認する
+    if not input_file.exists():
+        raise FileNotFoundError(f"❌ エラー: {input_path} が見つかりません。")
+
+    print(f"📖 {input_path} を逐次読み込みます...")
+
+    return _iter_persona_items(input_file, fields)
+
+
+def _iter_persona_items(input_file: Path, fields: Optional[Iterable[str]]) -> Iterator[dict]:
+    """JSON配列の要素を1件ずつ返すジェネレータ。"""
+    if fields is not None:
+        fields = tuple(fields)
+
+    with open(input_file, "rb") as f:
+        for persona in ijson.items(f, "item", use_float=True):
+            yield persona if fields is None else _project(persona, fields)
+
+
+def _project(persona: dict, fields: Iterable[str]) -> dict:
+    """ペルソナから指定の項目だけを残した辞書を作成する（存在しない項目は含めない）。"""
+    return {key: persona[key] for key in fields if key in persona}
@@ -6,27 +6,44 @@ LangGraphを使用したマルチエージェント対話システム。
 import asyncio
 import json
 import os
+from functools import lru_cache
 from pathlib import Path
 from typing import Annotated, List, Optional
 
 import pandas as pd
+from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import END, START, StateGraph
 from tqdm.asyncio import tqdm
 from typing_extensions import TypedDict
 import operator
 
+from . import aio
+from .cache import ResponseCache
 from .config import load_config
-from .llm import create_llm
-from .prompts import get_interviewer_system_prompt, get_persona_system_prompt
+from .llm import build_system_content, create_llm, mark_cache_breakpoint, max_tokens_param, pooled_llm
+from .prompts import get_interview_persona_system_prompt, get_interviewer_system_prompt
+from .results import open_result_writer, read_results
+
+# 出力CSVの列
+RESULT_COLUMNS = ["ID", "Occupation", "Age", "Conversation_Log", "Final_Answer"]
+
+# トランスクリプトの話者ラベル（初期質問, 回答, 深掘り質問）
+_ROLES = ("【Initial Question】", "【Persona Answer】", "【Interviewer Question】")
+
+# 状態に保持するペルソナのフィールド（結果の出力に使用するもののみ）
+_PROFILE_FIELDS = ("uuid", "occupation", "age")
 
 
 class InterviewState(TypedDict):
     """インタビューの状態。"""
 
-    messages: Annotated[List[BaseMessage], operator.add]  # 追記専用メッセージ履歴
-    persona_profile: dict
-    turn_count: int
+    messages: Annotated[List[BaseMessage], operator.add]  # 追記専用メッセージ履歴（ペルソナ視点: 質問=Human, 回答=AI）
+    persona_profile: dict  # 結果の出力に使用するフィールドのみ（_PROFILE_FIELDS）
+    system_message: SystemMessage  # ペルソナのシステムメッセージ（インタビュー開始時に一度だけ生成し、全ターンで共有）
+    turn_count: Annotated[int, operator.add]  # 深掘り質問の回数（各ノードの戻り値を加算する）
+    max_turns: int  # 深掘り質問の最大回数
 
 
 class InterviewRunner:
@@ -45,27 +62,49 @@ class InterviewRunner:
 
         # LLM初期化
         self.llm = create_llm(self.config)
+        # レスポンスキャッシュ（無効の場合はNone）
+        self.cache = ResponseCache.from_config(self.config)
 
         # 設定値
         self.input_file = self.config["interview"]["input_file"]
         self.output_file = self.config["interview"]["output_file"]
         self.max_turns = self.config["interview"]["max_turns"]
         self.concurrent_limit = self.config["interview"]["concurrent_limit"]
+        self.call_timeout = self.config["interview"].get("call_timeout")
+        self.final_turn_max_tokens = self.config["interview"].get("final_turn_max_tokens")
         self.initial_question = self.config["interview"]["initial_question"]
+        self.csv_encoding = self.config.get("csv_encoding", "utf-8")
+
+        # インタビュアーのシステムメッセージ（全インタビュー共通のため事前に生成）
+        self._interviewer_message = SystemMessage(
+            content=build_system_content(get_interviewer_system_prompt(), self.config)
+        )
 
-        # LangGraphワークフロー構築
+        # LangGraphワークフロー（全インスタンスで共有）
         self.app = self._build_workflow()
 
-    def _build_workflow(self) -> "CompiledStateGraph":
+    @staticmethod
+    @lru_cache(maxsize=1)
+    def _build_workflow() -> "CompiledStateGraph":
         """LangGraphワークフローを構築する。
 
+        ワークフローはランナーの設定に依存しないため、一度だけコンパイルして全インスタンスで共有する。
+        各ノードは実行時の config["configurable"] からランナー（runner）とLLMクライアント（llm）を取得して処理を委譲し、
+        最大ターン数は状態（max_turns）から参照する。
+
         Returns:
             CompiledStateGraph: コンパイルされたワークフロー
         """
         workflow = StateGraph(InterviewState)
 
-        workflow.add_node("interviewer", self._interviewer_node)
-        workflow.add_node("persona", self._persona_node)
+        async def interviewer(state: InterviewState, config: RunnableConfig) -> dict:
+            return await config["configurable"]["runner"]._interviewer_node(state, config["configurable"]["llm"])
+
+        async def persona(state: InterviewState, config: RunnableConfig) -> dict:
+            return await config["configurable"]["runner"]._persona_node(state, config["configurable"]["llm"])
+
+        workflow.add_node("interviewer", interviewer)
+        workflow.add_node("persona", persona)
 
         workflow.add_edge(START, "persona")
 
@@ -78,7 +117,7 @@ class InterviewRunner:
             Returns:
                 str: 次のノード名（"interviewer" or END）
             """
-            if state["turn_count"] >= self.max_turns:
+            if state["turn_count"] >= state["max_turns"]:
                 return END
             return "interviewer"
 
@@ -87,95 +126,146 @@ class InterviewRunner:
 
         return workflow.compile()
 
-    async def _persona_node(self, state: InterviewState) -> dict:
-        """ペルソナノード。
+    async def _ainvoke(self, llm: BaseChatModel, messages: list, **kwargs) -> str:
+        """LLMを呼び出して応答テキストを返す。
+
+        レスポンスキャッシュが有効な場合、同じメッセージに対する過去の応答があればそれを返す。
+        call_timeout を超えた呼び出しは打ち切り、並列実行枠を次のペルソナに明け渡す。
 
         Args:
-            state: 現在の状態
+            llm: LLMクライアント
+            messages: 送信するメッセージリスト
+            **kwargs: 呼び出しごとに指定するパラメータ（max_tokens等）
 
         Returns:
-            dict: 更新された状態
+            str: 応答テキスト
+
+        Raises:
+            asyncio.TimeoutError: call_timeout 以内に応答が得られなかった場合
         """
-        profile = state["persona_profile"]
+        if self.cache is not None:
+            return await asyncio.wait_for(self.cache.ainvoke(llm, messages, **kwargs), self.call_timeout)
 
-        system_prompt = f"""You are a real Japanese person with the following profile.
+        response = await asyncio.wait_for(llm.ainvoke(messages, **kwargs), self.call_timeout)
+        return response.content
 
-## Your Profile
-- Age: {profile.get("age")} / Sex: {profile.get("sex")}
-- Occupation: {profile.get("occupation")}
-- Region: {profile.get("prefecture")}
+    async def _persona_node(self, state: InterviewState, llm: BaseChatModel) -> dict:
+        """ペルソナノード。
 
-## Detailed Persona & Values
-- Personality: {profile.get("persona")}
-- Professional Stance: {profile.get("professional_persona")}
-- Hobbies: {profile.get("hobbies_and_interests")}
+        Args:
+            state: 現在の状態
+            llm: LLMクライアント
 
-Please answer the interviewer's questions acting fully as this person.
-Speak your "honest feelings" and "concerns" based on your daily life reality, not just shallow polite answers.
-"""
+        Returns:
+            dict: 更新された状態
+        """
+        # 静的なペルソナプロンプトを先頭に置き、2ターン目以降はプロバイダーのプロンプトキャッシュを利用する
+        messages = [state["system_message"]]
+        messages.extend(state["messages"])
+
+        # 最終ターンの回答（Final_Answer）は final_turn_max_tokens で出力トークン数を抑える
+        kwargs = {}
+        if self.final_turn_max_tokens and state["turn_count"] >= state["max_turns"]:
+            kwargs = max_tokens_param(self.final_turn_max_tokens, self.config)
 
-        messages = [SystemMessage(content=system_prompt)] + state["messages"]
-        response = await self.llm.ainvoke(messages)
+        content = await self._ainvoke(llm, mark_cache_breakpoint(messages, self.config), **kwargs)
 
-        return {"messages": [response], "turn_count": 0}
+        return {"messages": [AIMessage(content=content)], "turn_count": 0}
 
-    async def _interviewer_node(self, state: InterviewState) -> dict:
+    async def _interviewer_node(self, state: InterviewState, llm: BaseChatModel) -> dict:
         """インタビュアーノード。
 
         Args:
             state: 現在の状態
+            llm: LLMクライアント
 
         Returns:
             dict: 更新された状態
         """
-        last_answer = state["messages"][-1].content
+        # 対話履歴全体を送信し、前ターンのリクエストがそのままプレフィックスとなるようにする
+        messages = [self._interviewer_message]
+        messages.extend(self._to_interviewer_view(state["messages"]))
 
-        system_prompt = get_interviewer_system_prompt()
+        content = await self._ainvoke(llm, mark_cache_breakpoint(messages, self.config))
 
-        messages = [
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=f"Respondent's Answer: {last_answer}\n\nCreate ONE deep-dive question for this."),
-        ]
+        # 履歴はペルソナ視点で保持するため、インタビュアーの質問はHumanMessageとして追加する
+        return {"messages": [HumanMessage(content=content)], "turn_count": 1}
+
+    def _to_interviewer_view(self, messages: List[BaseMessage]) -> List[BaseMessage]:
+        """ペルソナ視点のメッセージ履歴をインタビュアー視点に変換する。
 
-        response = await self.llm.ainvoke(messages)
+        回答者の回答をHumanMessage、インタビュアー自身の質問をAIMessageとする。
+        初期質問は最初の回答と合わせて1つのHumanMessageにまとめ、各ターンで同じ内容となるようにする。
 
-        return {"messages": [response], "turn_count": 1}
+        Args:
+            messages: ペルソナ視点のメッセージ履歴（初期質問, 回答, 質問, 回答, ...）
+
+        Returns:
+            List[BaseMessage]: インタビュアー視点のメッセージ履歴
+        """
+        initial_question, first_answer, *rest = messages
 
-    async def _run_single_interview(self, persona: dict, semaphore: asyncio.Semaphore) -> Optional[dict]:
+        view = [
+            HumanMessage(
+                content=f"Initial Question: {initial_question.content}\n\nRespondent's Answer: {first_answer.content}"
+            )
+        ]
+        for msg in rest:
+            if isinstance(msg, AIMessage):
+                view.append(HumanMessage(content=msg.content))
+            else:
+                view.append(AIMessage(content=msg.content))
+
+        return view
+
+    async def _run_single_interview(
+        self, persona: dict, llm: BaseChatModel, max_turns: int, initial_question: str
+    ) -> Optional[dict]:
         """単一ペルソナに対してインタビューを実行する。
 
         Args:
             persona: ペルソナプロフィール
-            semaphore: 並列実行制御用セマフォ
+            llm: LLMクライアント
+            max_turns: 深掘り質問の最大回数
+            initial_question: 初期質問
 
         Returns:
             Optional[dict]: インタビュー結果
         """
-        async with semaphore:
-            try:
-                initial_state = {
-                    "messages": [HumanMessage(content=self.initial_question)],
-                    "persona_profile": persona,
-                    "turn_count": 0,
-                }
-
-                final_state = await self.app.ainvoke(initial_state)
-
-                # トランスクリプト作成
-                transcript = self._create_transcript(final_state["messages"])
-                final_answer = final_state["messages"][-1].content
-
-                return {
-                    "ID": persona.get("uuid"),
-                    "Occupation": persona.get("occupation"),
-                    "Age": persona.get("age"),
-                    "Conversation_Log": transcript,
-                    "Final_Answer": final_answer,
-                }
-
-            except Exception as e:
-                print(f"Error processing {persona.get("uuid")}: {e}")
-                return None
+        try:
+            # プロフィール全文はシステムプロンプトの生成にのみ使用し、状態には出力に必要なフィールドだけを保持する
+            initial_state = {
+                "messages": [HumanMessage(content=initial_question)],
+                "persona_profile": {key: persona.get(key) for key in _PROFILE_FIELDS},
+                "system_message": SystemMessage(
+                    content=build_system_content(get_interview_persona_system_prompt(persona), self.config)
+                ),
+                "turn_count": 0,
+                "max_turns": max_turns,
+            }
+
+            final_state = await self.app.ainvoke(initial_state, config={"configurable": {"runner": self, "llm": llm}})
+
+            # トランスクリプト作成
+            transcript = self._create_transcript(final_state["messages"])
+            final_answer = final_state["messages"][-1].content
+            profile = final_state["persona_profile"]
+
+            return {
+                "ID": profile["uuid"],
+                "Occupation": profile["occupation"],
+                "Age": profile["age"],
+                "Conversation_Log": transcript,
+                "Final_Answer": final_answer,
+            }
+
+        except asyncio.TimeoutError:
+            print(f"Timeout processing {persona.get('uuid')}: no response within {self.call_timeout}s")
+            return None
+
+        except Exception as e:
+            print(f"Error processing {persona.get('uuid')}: {e}")
+            return None
 
     def _create_transcript(self, messages: List[BaseMessage]) -> str:
         """メッセージ履歴からトランスクリプトを作成する。
@@ -186,19 +276,14 @@ Speak your "honest feelings" and "concerns" based on your daily life reality, no
         Returns:
             str: トランスクリプト
         """
-        transcript = ""
+        parts = []
 
         for idx, msg in enumerate(messages):
-            if idx == 0:
-                role = "【Initial Question】"
-            elif idx % 2 != 0:
-                role = "【Persona Answer】"
-            else:
-                role = "【Interviewer Question】"
+            # 初期質問以降は、回答（奇数番目）と深掘り質問（偶数番目）が交互に並ぶ
+            role = _ROLES[0] if idx == 0 else _ROLES[2 - idx % 2]
+            parts.append(f"{role}\n{msg.content}\n\n")
 
-            transcript += f"{role}\n{msg.content}\n\n"
-
-        return transcript
+        return "".join(parts)
 
     async def run_async(
         self,
@@ -237,26 +322,31 @@ Speak your "honest feelings" and "concerns" based on your daily life reality, no
 
         print(f"🚀 LangGraph Interview Start: {len(personas)} people (Concurrent: {concurrent_limit})")
 
-        semaphore = asyncio.Semaphore(concurrent_limit)
+        # 最初に完了したインタビューのログ（サンプル表示用）
+        sample_log = None
+
+        async with pooled_llm(self.config, concurrent_limit) as llm:
+            with open_result_writer(output_file, RESULT_COLUMNS, self.csv_encoding) as write_row:
+                with tqdm(total=len(personas)) as progress:
 
-        tasks = [self._run_single_interview(p, semaphore) for p in personas]
+                    async def interview(persona: dict) -> None:
+                        nonlocal sample_log
+                        res = await self._run_single_interview(persona, llm, max_turns, initial_question)
+                        if res:
+                            write_row(res)
+                            sample_log = sample_log or res["Conversation_Log"]
+                        progress.update(1)
 
-        results = []
-        for f in tqdm(asyncio.as_completed(tasks), total=len(tasks)):
-            res = await f
-            if res:
-                results.append(res)
+                    # 固定数のワーカーで実行し、同時に存在するインタビューを並列実行数分に抑える
+                    await aio.run_worker_pool(personas, interview, concurrent_limit)
 
-        # 結果の保存
-        df = pd.DataFrame(results)
-        df.to_csv(output_file, index=False, encoding="utf-8-sig")
         print(f"\n✅ Interview Completed. Saved to '{output_file}'.")
 
-        if not df.empty:
+        if sample_log:
             print("\n=== Sample Log (Top 1) ===")
-            print(df.iloc[0]["Conversation_Log"][:1000] + "...")
+            print(sample_log[:1000] + "...")
 
-        return df
+        return read_results(output_file, self.csv_encoding)
 
     def run(
         self,
@@ -278,7 +368,7 @@ Speak your "honest feelings" and "concerns" based on your daily life reality, no
         Returns:
             pd.DataFrame: インタビュー結果
         """
-        return asyncio.run(
+        return aio.run(
             self.run_async(
                 input_file=input_file,
                 output_file=output_file,
@@ -3,10 +3,16 @@
 複数のLLMプロバイダー（Azure OpenAI、OpenAI、Gemini、Anthropic、Groq）に対応し、
 設定ファイルで簡単に切り替えられるようにする。
 """
-from typing import Optional
+import importlib.util
+import json
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import AsyncIterator, Optional, Sequence, Union
 
+import httpx
 from langchain_anthropic import ChatAnthropic
-from langchain_core.language_models.chat_model import BaseChatModel
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_groq import ChatGroq
 from langchain_openai import AzureChatOpenAI, ChatOpenAI
@@ -30,12 +36,126 @@ PROVIDER_MAP = {
     "groq": ChatGroq,
 }
 
+# プロバイダーと設定取得関数のマッピング
+_PROVIDER_CONFIG_GETTERS = {
+    "azure_openai": get_azure_openai_config,
+    "openai": get_openai_config,
+    "gemini": get_gemini_config,
+    "anthropic": get_anthropic_config,
+    "groq": get_groq_config,
+}
+
+# HTTP/2はh2パッケージがインストールされている場合のみ有効にする（httpx[http2]）
+_HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+def create_http_async_client(max_in_flight: int) -> httpx.AsyncClient:
+    """LLM呼び出しで共有する非同期HTTPクライアントを作成する。
+
+    接続プールを全リクエストで共有し、TLSハンドシェイクを再利用する。
+    同時接続数は制限せず（並列数は呼び出し側のワーカー数で制御する）、同時に送信するリクエスト数の上限分の接続を
+    キープアライブで保持する。
+    h2パッケージが利用できる場合はHTTP/2を有効にし、1つの接続で複数のリクエストを多重化する。
+    プールは作成したイベントループに紐づくため、実行ごとに async with で作成して終了時に閉じること。
+
+    Args:
+        max_in_flight: 同時に送信するリクエスト数の上限（保持する接続数）
+
+    Returns:
+        httpx.AsyncClient: 非同期HTTPクライアント
+    """
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=max_in_flight)
+    return httpx.AsyncClient(limits=limits, http2=_HTTP2_AVAILABLE)
+
+
+@asynccontextmanager
+async def pooled_llm(config: dict, max_in_flight: int) -> AsyncIterator[BaseChatModel]:
+    """1回の実行で使用する、接続プールを共有したLLMクライアントを作成する。
+
+    クライアントは with ブロックを抜けると使用できなくなるため、ランナーの属性には保持せず、
+    実行中の処理へ引数として渡すこと（同じランナーで複数の実行を同時に行っても互いに干渉しない）。
 
-def create_llm(config: Optional[dict] = None) -> BaseChatModel:
+    Args:
+        config: 設定辞書
+        max_in_flight: 同時に送信するリクエスト数の上限（保持する接続数）
+
+    Yields:
+        BaseChatModel: LLMクライアント
+    """
+    async with create_http_async_client(max_in_flight) as http_client:
+        yield create_llm(config, http_async_client=http_client)
+
+
+def create_llm(config: Optional[dict] = None, http_async_client: Optional[httpx.AsyncClient] = None) -> BaseChatModel:
     """LLMを初期化する（プロバイダーに応じて切り替え）。
 
     Args:
         config: 設定辞書（オプション）。指定しない場合はconfig.yamlから読み込む。
+        http_async_client: 非同期呼び出しで使用するHTTPクライアント（オプション）。
+            接続プールを共有する場合に指定する。対応プロバイダー（azure_openai, openai, groq）のみ使用される。
+
+    Returns:
+        BaseChatModel: 初期化されたLLMクライアント
+
+    Raises:
+        ValueError: サポートされていないプロバイダーが指定された場合
+
+    Note:
+        http_async_client を指定しない場合、同じ設定に対しては同じクライアントを返す。
+        ランナーを繰り返し生成しても、クライアントと内部の接続プールが再利用される。
+    """
+    if http_async_client is not None:
+        return _build_llm(config, http_async_client)
+
+    if config is None:
+        config = load_config()
+
+    return _create_llm_cached(json.dumps(_get_llm_settings(config), sort_keys=True))
+
+
+def _get_llm_settings(config: Optional[dict] = None) -> dict:
+    """LLMクライアントの生成に使用する設定のみを抽出する。
+
+    クライアントの再利用やレスポンスキャッシュの名前空間など、モデル設定を識別するキーの生成に使用する。
+
+    Args:
+        config: 設定辞書（オプション）。指定しない場合はconfig.yamlから読み込む。
+
+    Returns:
+        dict: llm_provider、プロバイダー設定（環境変数による上書きを反映済み）、model_params、llm_request を含む辞書
+
+    Raises:
+        ValueError: サポートされていないプロバイダーが指定された場合
+    """
+    if config is None:
+        config = load_config()
+
+    provider = get_llm_provider(config)
+    getter = _PROVIDER_CONFIG_GETTERS.get(provider)
+    if getter is None:
+        supported = ", ".join(PROVIDER_MAP.keys())
+        raise ValueError(f"Unsupported provider: {provider}. Supported providers: {supported}")
+
+    return {
+        "llm_provider": provider,
+        provider: getter(config),
+        "model_params": config.get("model_params", {}),
+        "llm_request": config.get("llm_request", {}),
+    }
+
+
+@lru_cache(maxsize=8)
+def _create_llm_cached(key: str) -> BaseChatModel:
+    """設定のキーからLLMクライアントを生成する（キャッシュ用）。"""
+    return _build_llm(json.loads(key))
+
+
+def _build_llm(config: Optional[dict] = None, http_async_client: Optional[httpx.AsyncClient] = None) -> BaseChatModel:
+    """プロバイダーに応じたLLMクライアントを生成する。
+
+    Args:
+        config: 設定辞書（オプション）
+        http_async_client: 非同期呼び出しで使用するHTTPクライアント（オプション）
 
     Returns:
         BaseChatModel: 初期化されたLLMクライアント
@@ -46,20 +166,89 @@ def create_llm(config: Optional[dict] = None) -> BaseChatModel:
     provider = get_llm_provider(config)
 
     if provider == "azure_openai":
-        return _create_azure_openai_llm(config)
+        return _create_azure_openai_llm(config, http_async_client)
     elif provider == "openai":
-        return _create_openai_llm(config)
+        return _create_openai_llm(config, http_async_client)
     elif provider == "gemini":
         return _create_gemini_llm(config)
     elif provider == "anthropic":
         return _create_anthropic_llm(config)
     elif provider == "groq":
-        return _create_groq_llm(config)
+        return _create_groq_llm(config, http_async_client)
     else:
         supported = ", ".join(PROVIDER_MAP.keys())
         raise ValueError(f"Unsupported provider: {provider}. Supported providers: {supported}")
 
 
+def build_system_content(prompt: Union[str, Sequence[str]], config: Optional[dict] = None) -> Union[str, list[dict]]:
+    """プロバイダーのプロンプトキャッシュが効くようにシステムメッセージの内容を構築する。
+
+    Anthropicは明示的なキャッシュ指定（cache_control）が必要なため、テキストブロックに付与する。
+    OpenAI / Azure OpenAI / Groq / Gemini は共通のプレフィックスを自動でキャッシュするため、文字列のまま返す。
+    いずれの場合も、キャッシュを効かせるには同じプロンプトをメッセージの先頭に置いて再利用する必要がある。
+
+    プロンプトをブロックのリストで指定した場合、Anthropicでは各ブロックをキャッシュの区切りとする。
+    全リクエスト共通のブロックを先頭に置くと、そのブロックまでのキャッシュを異なるペルソナ間でも再利用できる。
+    Anthropicの区切りは1リクエストあたり最大4つのため、ブロック数は3つまで（会話履歴の区切りを含めて4つ）とすること。
+
+    Args:
+        prompt: システムプロンプト、または先頭から順に連結するプロンプトのブロック
+        config: 設定辞書（オプション）
+
+    Returns:
+        Union[str, list[dict]]: SystemMessageのcontentに指定する値
+    """
+    blocks = [prompt] if isinstance(prompt, str) else list(prompt)
+
+    if get_llm_provider(config) == "anthropic":
+        return [{"type": "text", "text": block, "cache_control": {"type": "ephemeral"}} for block in blocks]
+    return "".join(blocks)
+
+
+def mark_cache_breakpoint(messages: list[BaseMessage], config: Optional[dict] = None) -> list[BaseMessage]:
+    """会話履歴の末尾のメッセージをプロンプトキャッシュの区切りとする。
+
+    複数ターンの対話で、次のターンでは今回送信した履歴全体がキャッシュされたプレフィックスとして再利用される。
+    Anthropicのみ明示的な指定が必要なため、他のプロバイダーではそのまま返す。
+
+    Args:
+        messages: 送信するメッセージリスト
+        config: 設定辞書（オプション）
+
+    Returns:
+        list[BaseMessage]: 送信するメッセージリスト（state内のメッセージは変更しない）
+    """
+    if not messages or get_llm_provider(config) != "anthropic" or not isinstance(messages[-1].content, str):
+        return messages
+
+    last = messages[-1]
+    content = [{"type": "text", "text": last.content, "cache_control": {"type": "ephemeral"}}]
+    return messages[:-1] + [last.model_copy(update={"content": content})]
+
+
+def max_tokens_param(max_tokens: int, config: Optional[dict] = None) -> dict:
+    """呼び出しごとに出力トークン数の上限を指定するパラメータを取得する。
+
+    llm.ainvoke(messages, **max_tokens_param(200, config)) のように指定する。
+
+    Args:
+        max_tokens: 出力トークン数の上限
+        config: 設定辞書（オプション）
+
+    Returns:
+        dict: プロバイダーに応じたパラメータ（OpenAI系は max_completion_tokens、Geminiは max_output_tokens、
+            Anthropic・Groqは max_tokens）
+    """
+    provider = get_llm_provider(config)
+    # OpenAI系はモデル設定の上限を max_completion_tokens として送信するため、同じキーで上書きする
+    # （AzureChatOpenAI は呼び出し時の max_tokens を変換せず、両方を指定したリクエストは拒否される）
+    if provider in ("azure_openai", "openai"):
+        return {"max_completion_tokens": max_tokens}
+    if provider == "gemini":
+        return {"max_output_tokens": max_tokens}
+    return {"max_tokens": max_tokens}
+
+
 def _get_model_params(config: Optional[dict] = None) -> dict:
     """共通のモデルパラメータを取得する。
 
@@ -83,14 +272,44 @@ def _get_model_params(config: Optional[dict] = None) -> dict:
     elif "max_tokens" in model_params:
         params["max_tokens"] = model_params["max_tokens"]
 
+    params.update(_get_request_params(config))
+
+    return params
+
+
+def _get_request_params(config: Optional[dict] = None) -> dict:
+    """リクエストのタイムアウトとリトライ回数を取得する。
+
+    リトライ時の待機は各プロバイダーのSDKが指数バックオフ（ジッター付き）で行う。
+
+    Args:
+        config: 設定辞書（オプション）
+
+    Returns:
+        dict: クライアントに渡すパラメータ（timeout, max_retries）
+    """
+    if config is None:
+        config = load_config()
+
+    request_config = config.get("llm_request") or {}
+
+    params = {}
+    if request_config.get("timeout") is not None:
+        params["timeout"] = request_config["timeout"]
+    if request_config.get("max_retries") is not None:
+        params["max_retries"] = request_config["max_retries"]
+
     return params
 
 
-def _create_azure_openai_llm(config: Optional[dict] = None) -> AzureChatOpenAI:
+def _create_azure_openai_llm(
+    config: Optional[dict] = None, http_async_client: Optional[httpx.AsyncClient] = None
+) -> AzureChatOpenAI:
     """Azure OpenAI Chatモデルを初期化する。
 
     Args:
         config: 設定辞書（オプション）
+        http_async_client: 非同期呼び出しで使用するHTTPクライアント（オプション）
 
     Returns:
         AzureChatOpenAI: 初期化されたLLMクライアント
@@ -103,15 +322,19 @@ def _create_azure_openai_llm(config: Optional[dict] = None) -> AzureChatOpenAI:
         api_key=provider_config["api_key"],
         api_version=provider_config["api_version"],
         deployment_name=provider_config["deployment_name"],
+        http_async_client=http_async_client,
         **model_params,
     )
 
 
-def _create_openai_llm(config: Optional[dict] = None) -> ChatOpenAI:
+def _create_openai_llm(
+    config: Optional[dict] = None, http_async_client: Optional[httpx.AsyncClient] = None
+) -> ChatOpenAI:
     """OpenAI Chatモデルを初期化する。
 
     Args:
         config: 設定辞書（オプション）
+        http_async_client: 非同期呼び出しで使用するHTTPクライアント（オプション）
 
     Returns:
         ChatOpenAI: 初期化されたLLMクライアント
@@ -126,6 +349,7 @@ def _create_openai_llm(config: Optional[dict] = None) -> ChatOpenAI:
     return ChatOpenAI(
         api_key=provider_config["api_key"],
         model=provider_config.get("model", "gpt-4o"),
+        http_async_client=http_async_client,
         **model_params,
         **kwargs,
     )
@@ -173,11 +397,14 @@ def _create_anthropic_llm(config: Optional[dict] = None) -> ChatAnthropic:
     )
 
 
-def _create_groq_llm(config: Optional[dict] = None) -> ChatGroq:
+def _create_groq_llm(
+    config: Optional[dict] = None, http_async_client: Optional[httpx.AsyncClient] = None
+) -> ChatGroq:
     """Groq Chatモデルを初期化する。
 
     Args:
         config: 設定辞書（オプション）
+        http_async_client: 非同期呼び出しで使用するHTTPクライアント（オプション）
 
     Returns:
         ChatGroq: 初期化されたLLMクライアント
@@ -188,5 +415,6 @@ def _create_groq_llm(config: Optional[dict] = None) -> ChatGroq:
     return ChatGroq(
         api_key=provider_config["api_key"],
         model=provider_config.get("model", "gpt-oss-120b"),
+        http_async_client=http_async_client,
         **model_params,
     )
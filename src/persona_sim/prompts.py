@@ -4,6 +4,17 @@
 """
 from typing import Optional
 
+# 自由記述フィールドの最大文字数（極端に長いプロフィールでプロンプトが肥大化しないようにする）
+_MAX_FIELD_CHARS = 400
+
+# 最大文字数を適用する自由記述フィールド
+_FREE_TEXT_FIELDS = ("persona", "professional_persona", "hobbies_and_interests", "cultural_background")
+
+# 詳細なプロンプトの共通部分（全ペルソナで同一）
+_DETAILED_FRAMING = """あなたは以下のプロフィールを持つ実在の日本人として振る舞ってください。
+
+"""
+
 
 def get_persona_system_prompt(profile: dict, detailed: bool = True) -> str:
     """ペルソナプロフィールからシステムプロンプトを生成する。
@@ -27,33 +38,103 @@ def _get_simple_prompt(profile: dict) -> str:
 
 - Age: {profile.get('age')} / Sex: {profile.get('sex')}
 - Occupation: {profile.get('occupation')}
-- Personality/Values: {profile.get('persona')}
-- Hobbies/Interests: {profile.get('hobbies_and_interests')}
+- Personality/Values: {_field(profile, 'persona')}
+- Hobbies/Interests: {_field(profile, 'hobbies_and_interests')}
 
 Please answer intuitively and based on your daily life context, acting as this person.
 """
 
 
+def get_batch_persona_system_prompt(profiles: list[dict]) -> str:
+    """複数ペルソナをまとめて演じさせるシステムプロンプトを生成する（A/Bテストのバッチ評価用）。
+
+    Args:
+        profiles: ペルソナプロフィール辞書のリスト
+
+    Returns:
+        str: システムプロンプト
+    """
+    blocks = [
+        f"""- id: {profile.get('uuid')}
+  - Age: {profile.get('age')} / Sex: {profile.get('sex')}
+  - Occupation: {profile.get('occupation')}
+  - Personality/Values: {_field(profile, 'persona')}
+  - Hobbies/Interests: {_field(profile, 'hobbies_and_interests')}"""
+        for profile in profiles
+    ]
+    people = "\n".join(blocks)
+    return f"""You will act as each of the following real Japanese people, one at a time and independently of each other.
+
+{people}
+
+For each person, answer intuitively and based on that person's daily life context, never letting the other people influence the answer.
+"""
+
+
+def get_persona_system_prompt_blocks(profile: dict) -> list[str]:
+    """詳細なシステムプロンプトを、全ペルソナ共通のブロックとペルソナ固有のブロックに分けて生成する。
+
+    連結すると get_persona_system_prompt(profile) と同じ内容になる。
+    共通のブロックを先頭に置くことで、プロンプトキャッシュを異なるペルソナ間でも再利用できる。
+
+    Args:
+        profile: ペルソナプロフィール辞書
+
+    Returns:
+        list[str]: プロンプトのブロック（共通の前置き, プロフィールと回答の指示）
+    """
+    return [_DETAILED_FRAMING, _get_detailed_profile(profile)]
+
+
 def _get_detailed_prompt(profile: dict) -> str:
     """詳細なプロンプト（アンケート・インタビュー用）。"""
-    return f"""あなたは以下のプロフィールを持つ実在の日本人として振る舞ってください。
+    return "".join(get_persona_system_prompt_blocks(profile))
+
 
-## プロフィール
+def _get_detailed_profile(profile: dict) -> str:
+    """詳細なプロンプトのペルソナ固有部分。"""
+    return f"""## プロフィール
 - ID: {profile.get('uuid')}
 - 年齢: {profile.get('age')}歳 / 性別: {profile.get('sex')}
 - 居住地: {profile.get('prefecture')} ({profile.get('region')})
 - 職業: {profile.get('occupation')}
 
 ## 詳細な人物像 (Context)
-- 性格: {profile.get('persona')}
-- 仕事観: {profile.get('professional_persona')}
-- 趣味: {profile.get('hobbies_and_interests')}
-- 背景: {profile.get('cultural_background')}
+- 性格: {_field(profile, 'persona')}
+- 仕事観: {_field(profile, 'professional_persona')}
+- 趣味: {_field(profile, 'hobbies_and_interests')}
+- 背景: {_field(profile, 'cultural_background')}
 
 あなたはアンケートの回答者です。AIではなく、この人格そのものとして、一人称で自然に回答してください。
 """
 
 
+def get_interview_persona_system_prompt(profile: dict) -> str:
+    """デプスインタビューの回答者用システムプロンプトを生成する。
+
+    Args:
+        profile: ペルソナプロフィール辞書
+
+    Returns:
+        str: システムプロンプト
+    """
+    return f"""You are a real Japanese person with the following profile.
+
+## Your Profile
+- Age: {profile.get("age")} / Sex: {profile.get("sex")}
+- Occupation: {profile.get("occupation")}
+- Region: {profile.get("prefecture")}
+
+## Detailed Persona & Values
+- Personality: {_field(profile, "persona")}
+- Professional Stance: {_field(profile, "professional_persona")}
+- Hobbies: {_field(profile, "hobbies_and_interests")}
+
+Please answer the interviewer's questions acting fully as this person.
+Speak your "honest feelings" and "concerns" based on your daily life reality, not just shallow polite answers.
+"""
+
+
 def get_interviewer_system_prompt() -> str:
     """インタビューアーのシステムプロンプトを取得する。
 
@@ -63,8 +144,28 @@ def get_interviewer_system_prompt() -> str:
     return """You are an expert User Researcher.
 Your job is to dig deeper into the respondent's answers by asking "Why?" or asking for "Specific scenes".
 
+Each user message is the respondent's latest answer. Reply with ONE deep-dive question for it.
+
 Rules:
 1. Focus on "ambiguous points" or "emotional points" in the answer.
 2. Keep questions short and piercing.
 3. Never state your own opinion; strictly ask questions.
 """
+
+
+def _field(profile: dict, key: str) -> Optional[str]:
+    """プロンプトに埋め込むフィールドの値を取得する。
+
+    自由記述フィールドは _MAX_FIELD_CHARS 文字を超える部分を切り詰める。
+
+    Args:
+        profile: ペルソナプロフィール辞書
+        key: フィールド名
+
+    Returns:
+        Optional[str]: フィールドの値
+    """
+    value = profile.get(key)
+    if key in _FREE_TEXT_FIELDS and isinstance(value, str) and len(value) > _MAX_FIELD_CHARS:
+        return value[:_MAX_FIELD_CHARS] + "…"
+    return value
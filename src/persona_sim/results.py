@@ -0,0 +1,45 @@
+"""結果CSV入出力モジュール。
+
+各ランナーの結果を1件ずつCSVへ書き出し、実行完了後にDataFrameとして読み込む。
+"""
+import csv
+from contextlib import contextmanager
+from typing import Callable, Iterator, Sequence
+
+import pandas as pd
+
+# 結果CSVの書き込みバッファサイズ（1行ごとの書き込みをまとめてディスクへ出力する）
+CSV_BUFFER_SIZE = 1024 * 1024
+
+
+@contextmanager
+def open_result_writer(output_file: str, columns: Sequence[str], encoding: str) -> Iterator[Callable[[dict], object]]:
+    """結果CSVを開き、1件ずつ書き出す関数を返す。
+
+    結果は呼び出しごとにCSVへ書き出し、メモリには保持しない。
+
+    Args:
+        output_file: 出力CSVファイルパス
+        columns: 出力する列名
+        encoding: CSVファイルのエンコーディング
+
+    Yields:
+        Callable[[dict], object]: 結果1件を書き出す関数
+    """
+    with open(output_file, "w", newline="", encoding=encoding, buffering=CSV_BUFFER_SIZE) as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        yield writer.writerow
+
+
+def read_results(output_file: str, encoding: str) -> pd.DataFrame:
+    """結果CSVをDataFrameとして読み込む。
+
+    Args:
+        output_file: 結果CSVファイルパス
+        encoding: CSVファイルのエンコーディング
+
+    Returns:
+        pd.DataFrame: 結果のDataFrame（IDは文字列として読み込む）
+    """
+    return pd.read_csv(output_file, encoding=encoding, dtype={"ID": str})
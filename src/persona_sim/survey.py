@@ -1,18 +1,28 @@
 """アンケート調査モジュール。
 
 ペルソナに対してシンプルな一問一答のアンケートを実施する。
+各ペルソナへの質問は互いに独立しているため、並列数を制限しながら並列に実行する（プロバイダーのBatch APIも利用可能）。
 """
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Optional
 
 import pandas as pd
+from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
-from tqdm import tqdm
+from tqdm.asyncio import tqdm
 
+from . import aio
+from .batch import run_batch
+from .cache import ResponseCache
 from .config import load_config
-from .llm import create_llm
-from .prompts import get_persona_system_prompt
+from .llm import build_system_content, create_llm, pooled_llm
+from .prompts import get_persona_system_prompt, get_persona_system_prompt_blocks
+from .results import open_result_writer, read_results
+
+# 出力CSVの列
+RESULT_COLUMNS = ["ID", "Age", "Sex", "Occupation", "Prefecture", "Context_Summary", "Survey_Answer"]
 
 
 class SurveyRunner:
@@ -31,18 +41,72 @@ class SurveyRunner:
 
         # LLM初期化（プロバイダーに応じて切り替え）
         self.llm = create_llm(self.config)
+        # レスポンスキャッシュ（無効の場合はNone）
+        self.cache = ResponseCache.from_config(self.config)
 
         # 設定値
         self.input_file = self.config["survey"]["input_file"]
         self.output_dir = self.config["survey"]["output_dir"]
         self.output_file = self.config["survey"]["output_file"]
         self.survey_question = self.config["survey"]["question"]
+        self.csv_encoding = self.config.get("csv_encoding", "utf-8")
+        self.concurrent_limit = self.config["survey"].get("concurrent_limit", 10)
+        # プロバイダーのBatch APIで一括実行するか（非対話の一括処理向け、約50%安価）
+        self.provider_batch = self.config["survey"].get("provider_batch", False)
+        # 同期APIをスレッドプールで並列実行するか（非同期クライアントを使用しない場合）
+        self.use_threads = self.config["survey"].get("use_threads", False)
+
+    async def run_async(
+        self,
+        input_file: Optional[str] = None,
+        output_file: Optional[str] = None,
+        question: Optional[str] = None,
+        concurrent_limit: Optional[int] = None,
+    ) -> pd.DataFrame:
+        """全ペルソナに対してアンケートを非同期で実行する。
+
+        Args:
+            input_file: 入力JSONファイルパス（オプション）
+            output_file: 出力CSVファイルパス（オプション）
+            question: アンケート質問文（オプション）
+            concurrent_limit: 並列実行数（オプション）
+
+        Returns:
+            pd.DataFrame: アンケート結果
+        """
+        # パス設定
+        input_file = input_file or self.input_file
+        output_file = output_file or str(Path(self.output_dir) / self.output_file)
+        question = question or self.survey_question
+        concurrent_limit = concurrent_limit or self.concurrent_limit
+
+        # 出力ディレクトリ作成
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+
+        # ペルソナデータ読み込み
+        from .data import load_personas
+
+        personas = load_personas(input_file)
+
+        print(f"🚀 {len(personas)} 人のペルソナに対してアンケートを開始します...")
+
+        async with pooled_llm(self.config, concurrent_limit) as llm:
+            with open_result_writer(output_file, RESULT_COLUMNS, self.csv_encoding) as write_row:
+                if self.provider_batch:
+                    await self._run_provider_batch(personas, question, write_row, concurrent_limit, llm)
+                else:
+                    await self._run_concurrent(personas, question, write_row, concurrent_limit, llm)
+
+        print(f"\n✅ 全処理完了。結果を '{output_file}' に保存しました。")
+
+        return read_results(output_file, self.csv_encoding)
 
     def run(
         self,
         input_file: Optional[str] = None,
         output_file: Optional[str] = None,
         question: Optional[str] = None,
+        concurrent_limit: Optional[int] = None,
     ) -> pd.DataFrame:
         """全ペルソナに対してアンケートを実行する。
 
@@ -50,6 +114,32 @@ class SurveyRunner:
             input_file: 入力JSONファイルパス（オプション）
             output_file: 出力CSVファイルパス（オプション）
             question: アンケート質問文（オプション）
+            concurrent_limit: 並列実行数（オプション）
+
+        Returns:
+            pd.DataFrame: アンケート結果
+        """
+        if self.use_threads:
+            return self.run_threaded(input_file, output_file, question, concurrent_limit)
+        return aio.run(self.run_async(input_file, output_file, question, concurrent_limit))
+
+    def run_threaded(
+        self,
+        input_file: Optional[str] = None,
+        output_file: Optional[str] = None,
+        question: Optional[str] = None,
+        concurrent_limit: Optional[int] = None,
+    ) -> pd.DataFrame:
+        """全ペルソナに対してアンケートを、同期APIを用いてスレッドプールで並列実行する。
+
+        各呼び出しはネットワーク待ちの間GILを解放するため、asyncioを使用しなくても並列数に応じて高速化する。
+        非同期呼び出しに対応していないクライアントや、イベントループを使用できない環境向け。
+
+        Args:
+            input_file: 入力JSONファイルパス（オプション）
+            output_file: 出力CSVファイルパス（オプション）
+            question: アンケート質問文（オプション）
+            concurrent_limit: 並列実行数（オプション）
 
         Returns:
             pd.DataFrame: アンケート結果
@@ -58,6 +148,7 @@ class SurveyRunner:
         input_file = input_file or self.input_file
         output_file = output_file or str(Path(self.output_dir) / self.output_file)
         question = question or self.survey_question
+        concurrent_limit = concurrent_limit or self.concurrent_limit
 
         # 出力ディレクトリ作成
         os.makedirs(os.path.dirname(output_file), exist_ok=True)
@@ -67,24 +158,81 @@ class SurveyRunner:
 
         personas = load_personas(input_file)
 
-        results = []
         print(f"🚀 {len(personas)} 人のペルソナに対してアンケートを開始します...")
 
-        # ループ処理でAPIコール
-        for persona in tqdm(personas, desc="Progress"):
-            try:
-                result = self.run_single(persona, question)
-                results.append(result)
-            except Exception as e:
-                print(f"Error (ID: {persona.get('uuid')}): {e}")
-
-        # 結果の保存
-        df = pd.DataFrame(results)
-        df.to_csv(output_file, index=False, encoding="utf-8-sig")
+        # 完了したものから書き出す（書き込みは呼び出し元のスレッドのみで行う）
+        with open_result_writer(output_file, RESULT_COLUMNS, self.csv_encoding) as write_row:
+            with ThreadPoolExecutor(max_workers=concurrent_limit) as executor:
+                futures = {executor.submit(self.run_single, p, question): p for p in personas}
+                for future in tqdm(as_completed(futures), total=len(futures), desc="Progress"):
+                    try:
+                        write_row(future.result())
+                    except Exception as e:
+                        print(f"Error (ID: {futures[future].get('uuid')}): {e}")
 
         print(f"\n✅ 全処理完了。結果を '{output_file}' に保存しました。")
 
-        return df
+        return read_results(output_file, self.csv_encoding)
+
+    async def _run_concurrent(
+        self,
+        personas: list[dict],
+        question: str,
+        on_result: Callable[[dict], None],
+        concurrent_limit: int,
+        llm: BaseChatModel,
+    ) -> None:
+        """全ペルソナへの質問を、固定数のワーカーで並列に実行する。
+
+        Args:
+            personas: ペルソナプロフィールのリスト
+            question: 質問文
+            on_result: 回答結果1件ごとに呼び出すコールバック（失敗したペルソナは呼び出さない）
+            concurrent_limit: 並列実行数
+            llm: LLMクライアント
+        """
+        with tqdm(total=len(personas), desc="Progress") as progress:
+
+            async def ask(persona: dict) -> None:
+                try:
+                    on_result(await self.run_single_async(persona, question, llm))
+                except Exception as e:
+                    print(f"Error (ID: {persona.get('uuid')}): {e}")
+                progress.update(1)
+
+            await aio.run_worker_pool(personas, ask, concurrent_limit)
+
+    async def _run_provider_batch(
+        self,
+        personas: list[dict],
+        question: str,
+        on_result: Callable[[dict], None],
+        concurrent_limit: int,
+        llm: BaseChatModel,
+    ) -> None:
+        """プロバイダーのBatch APIで全ペルソナへの質問を一括実行する。
+
+        Batchで失敗したペルソナのみ、通常のAPIで再実行する。
+
+        Args:
+            personas: ペルソナプロフィールのリスト
+            question: 質問文
+            on_result: 回答結果1件ごとに呼び出すコールバック（失敗したペルソナは呼び出さない）
+            concurrent_limit: 通常APIでの再実行の並列実行数
+            llm: 通常APIでの再実行に使用するLLMクライアント
+        """
+        requests = [(f"p{i}", self._create_system_prompt(p), question) for i, p in enumerate(personas)]
+        outputs = await run_batch(requests, self.config)
+
+        missing = []
+        for i, persona in enumerate(personas):
+            if f"p{i}" in outputs:
+                on_result(self._create_result(persona, outputs[f"p{i}"]))
+            else:
+                missing.append(persona)
+
+        if missing:
+            await self._run_concurrent(missing, question, on_result, concurrent_limit, llm)
 
     def run_single(self, persona: dict, question: str) -> dict:
         """単一ペルソナに対してアンケートを実行する。
@@ -96,11 +244,12 @@ class SurveyRunner:
         Returns:
             dict: 回答結果
         """
-        system_prompt = self._create_system_prompt(persona)
+        messages = self._create_messages(persona, question)
+
+        if self.cache is not None:
+            return self._create_result(persona, self.cache.invoke(self.llm, messages))
 
-        response = self.llm.invoke(
-            [SystemMessage(content=system_prompt), HumanMessage(content=question)]
-        )
+        response = self.llm.invoke(messages)
 
         # AIMessageからcontentを取得
         if isinstance(response, AIMessage):
@@ -108,6 +257,53 @@ class SurveyRunner:
         else:
             answer = str(response)
 
+        return self._create_result(persona, answer)
+
+    async def run_single_async(self, persona: dict, question: str, llm: Optional[BaseChatModel] = None) -> dict:
+        """単一ペルソナに対してアンケートを非同期で実行する。
+
+        Args:
+            persona: ペルソナプロフィール
+            question: 質問文
+            llm: LLMクライアント（オプション）。指定しない場合はランナーのクライアントを使用する。
+
+        Returns:
+            dict: 回答結果
+        """
+        llm = llm or self.llm
+        messages = self._create_messages(persona, question)
+
+        if self.cache is not None:
+            return self._create_result(persona, await self.cache.ainvoke(llm, messages))
+
+        response = await llm.ainvoke(messages)
+        return self._create_result(persona, response.content)
+
+    def _create_messages(self, persona: dict, question: str) -> list:
+        """ペルソナへの質問メッセージを生成する。
+
+        Args:
+            persona: ペルソナプロフィール
+            question: 質問文
+
+        Returns:
+            list: 送信するメッセージリスト
+        """
+        # 全ペルソナ共通の指示、ペルソナ固有のプロフィールの順に置き、それぞれをプロンプトキャッシュの区切りとする
+        # （共通の指示までのキャッシュは全ペルソナで、プロフィールまでのキャッシュは同じペルソナへの再質問で再利用される）
+        system_content = build_system_content(get_persona_system_prompt_blocks(persona), self.config)
+        return [SystemMessage(content=system_content), HumanMessage(content=question)]
+
+    def _create_result(self, persona: dict, answer: str) -> dict:
+        """回答から出力用の結果レコードを作成する。
+
+        Args:
+            persona: ペルソナプロフィール
+            answer: 回答
+
+        Returns:
+            dict: 回答結果
+        """
         return {
             "ID": persona.get("uuid"),
             "Age": persona.get("age"),